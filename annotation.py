@@ -2,49 +2,230 @@
 The data model
 ==============
 """
-import gobject
 import calendar
 import datetime
 import heapq
 import copy
 import numpy as np
 import threading
+from contextlib import contextmanager
 from matplotlib.dates import date2num,num2date
 from timezone import UTC
 from colorsel import Colors
 from matplotlib.colors import rgb2hex
 
-class AnnotationsMeta(gobject.GObjectMeta):
-    def __init__(cls,*kwds):
-        gobject.GObjectMeta.__init__(cls,*kwds)
-        cls.__gtype_name__ = cls.__name__
-        gobject.signal_new('annotation-added', cls,
-                           gobject.SIGNAL_RUN_FIRST,
-                           gobject.TYPE_NONE,
-                           (gobject.TYPE_INT,gobject.TYPE_STRING,gobject.TYPE_DOUBLE,gobject.TYPE_DOUBLE))
-        gobject.signal_new('annotation-removed',cls,
-                           gobject.SIGNAL_RUN_FIRST,
-                           gobject.TYPE_NONE,
-                           (gobject.TYPE_INT,))
-        gobject.signal_new('context-added',cls,
-                           gobject.SIGNAL_RUN_FIRST,
-                           gobject.TYPE_NONE,
-                           (gobject.TYPE_STRING,gobject.TYPE_STRING))
-        gobject.signal_new('context-removed',cls,
-                           gobject.SIGNAL_RUN_FIRST,
-                           gobject.TYPE_NONE,
-                           (gobject.TYPE_STRING,))
-        gobject.signal_new('annotation-changed',cls,
-                           gobject.SIGNAL_RUN_FIRST,
-                           gobject.TYPE_NONE,
-                           (gobject.TYPE_INT,gobject.TYPE_STRING,gobject.TYPE_STRING,gobject.TYPE_DOUBLE,gobject.TYPE_DOUBLE))
-        gobject.type_register(cls)
+SIGNALS = ('annotation-added','annotation-removed','annotation-changed',
+           'context-added','context-removed','annotations-bulk-changed')
 
+UNIX_EPOCH = int(date2num(datetime.datetime(1970,1,1)))
 
-class Annotations(gobject.GObject):
+def unix2num(secs):
+    """
+    :param secs: Seconds since 1.1.1970
+    :type secs: :class:`numpy.ndarray`
+    :rtype: :class:`numpy.ndarray`
+
+    Converts UNIX timestamps to matplotlib date numbers."""
+    return UNIX_EPOCH + np.asarray(secs,dtype=float)/86400.0
+
+def num2unix(nums):
+    """
+    :param nums: matplotlib date numbers
+    :type nums: :class:`numpy.ndarray`
+    :rtype: :class:`numpy.ndarray`
+
+    Converts matplotlib date numbers to whole UNIX timestamps by dropping the fraction of the second.
+    Like :func:`matplotlib.dates.num2date` it treats times less than 10us before a full second as rounding errors."""
+    nums = np.asarray(nums,dtype=float)
+    days = np.floor(nums)
+    secs = np.floor(np.round((nums-days)*86400e6)/1e6+1e-5)
+    return ((days-UNIX_EPOCH)*86400+secs).astype(np.int64)
+
+def _parse_timestamps(fn,line,start,end):
+    try:
+        res = (float(start),float(end))
+    except ValueError:
+        res = None
+    if res is None or not np.isfinite(res).all():
+        raise IOError("Line "+str(line)+" of "+fn+" contains invalid timestamps")
+    return res
+
+class SortedColumn:
+    """
+    A column of values that is kept sorted, ties are ordered by the id of the annotation.
+    Every entry can carry an additional float as payload.
+    """
+    def __init__(self):
+        self.clear()
+    def clear(self):
+        """
+        Removes all entries from the column. """
+        self.values = np.empty(0)
+        self.ids = np.empty(0,dtype=np.int64)
+        self.payload = np.empty(0)
+    def position(self,value,id):
+        """
+        :returns: The position at which the entry is or would be stored
+        :rtype: :class:`int`"""
+        a = np.searchsorted(self.values,value,'left')
+        b = np.searchsorted(self.values,value,'right')
+        return a+np.searchsorted(self.ids[a:b],id)
+    def insert(self,value,id,payload=0.0):
+        i = self.position(value,id)
+        self.values = np.insert(self.values,i,value)
+        self.ids = np.insert(self.ids,i,id)
+        self.payload = np.insert(self.payload,i,payload)
+    def remove(self,value,id):
+        i = self.position(value,id)
+        if i == len(self.ids) or self.ids[i] != id or self.values[i] != value:
+            raise KeyError(id)
+        self.values = np.delete(self.values,i)
+        self.ids = np.delete(self.ids,i)
+        self.payload = np.delete(self.payload,i)
+    def extend(self,values,ids,payload):
+        """
+        Inserts many entries and sorts the column only once."""
+        values = np.concatenate((self.values,values))
+        ids = np.concatenate((self.ids,ids))
+        payload = np.concatenate((self.payload,payload))
+        order = np.lexsort((ids,values))
+        self.values = values[order]
+        self.ids = ids[order]
+        self.payload = payload[order]
+    def discard(self,ids):
+        """
+        Removes all entries belonging to the given ids in one pass."""
+        keep = np.logical_not(np.in1d(self.ids,ids))
+        self.values = self.values[keep]
+        self.ids = self.ids[keep]
+        self.payload = self.payload[keep]
+
+class IntervalIndex:
+    """
+    Keeps the start-times, end-times and lengths of all annotations in sorted arrays.
+    Point- and nearest-neighbour-queries are answered by bisection instead of scanning all annotations.
+    Ties between equal timestamps are broken by the annotation id.
+    """
+    def __init__(self):
+        self.starts = SortedColumn()
+        self.ends = SortedColumn()
+        self.lengths = SortedColumn()
+    def __len__(self):
+        return len(self.starts.ids)
+    def clear(self):
+        """
+        Removes all entries from the index. """
+        self.starts.clear()
+        self.ends.clear()
+        self.lengths.clear()
+    def add(self,id,boundl,boundr):
+        """
+        :param id: The id of the annotation
+        :type id: :class:`int`
+        :param boundl: The start time
+        :type boundl: :class:`float`
+        :param boundr: The end time
+        :type boundr: :class:`float`
+
+        Inserts an annotation into the index. """
+        self.starts.insert(boundl,id,boundr)
+        self.ends.insert(boundr,id)
+        self.lengths.insert(boundr-boundl,id)
+    def add_many(self,ids,starts,ends):
+        """
+        :param ids: The ids of the annotations
+        :type ids: :class:`numpy.ndarray`
+        :param starts: The start times
+        :type starts: :class:`numpy.ndarray`
+        :param ends: The end times
+        :type ends: :class:`numpy.ndarray`
+
+        Inserts many annotations and sorts the index only once."""
+        self.starts.extend(starts,ids,ends)
+        self.ends.extend(ends,ids,np.zeros(len(ids)))
+        self.lengths.extend(ends-starts,ids,np.zeros(len(ids)))
+    def bounds(self):
+        """
+        :returns: The smallest start-time and the biggest end-time or :const:`None` if the index is empty
+        :rtype: (:class:`float`, :class:`float`)"""
+        if len(self) == 0:
+            return (None,None)
+        return (float(self.starts.values[0]),float(self.ends.values[-1]))
+    def remove_many(self,ids):
+        """
+        :param ids: The ids of the annotations to remove
+        :type ids: :class:`numpy.ndarray`
+
+        Removes many annotations in one pass over the index."""
+        self.starts.discard(ids)
+        self.ends.discard(ids)
+        self.lengths.discard(ids)
+    def remove(self,id,boundl,boundr):
+        """
+        Removes an annotation that has been added with :func:`add` and the same parameters. """
+        self.starts.remove(boundl,id)
+        self.ends.remove(boundr,id)
+        self.lengths.remove(boundr-boundl,id)
+    def find(self,x):
+        """
+        :param x: The time where to search
+        :type x: :class:`float`
+        :returns: The ids of all annotations that include *x*, ordered by id
+        :rtype: \[ :class:`int` \]"""
+        return self.overlapping(x,x)
+    def overlapping(self,xl,xr):
+        """
+        :param xl: The start of the range
+        :type xl: :class:`float`
+        :param xr: The end of the range
+        :type xr: :class:`float`
+        :returns: The ids of all annotations that intersect the range, ordered by id
+        :rtype: \[ :class:`int` \]
+
+        Only annotations starting at most the longest annotation length before *xl* have to be checked."""
+        if len(self) == 0:
+            return []
+        lower = xl - self.lengths.values[-1]
+        lower -= abs(lower)*1e-12
+        lo = np.searchsorted(self.starts.values,lower,'left')
+        hi = np.searchsorted(self.starts.values,xr,'right')
+        hits = self.starts.ids[lo:hi][self.starts.payload[lo:hi] >= xl]
+        return np.sort(hits).tolist()
+    def nearest_left(self,x,exclude=None):
+        """
+        :returns: The id and end-time of the annotation ending closest before *x* or :const:`None`
+        :rtype: (:class:`int`, :class:`float`)"""
+        values = self.ends.values
+        j = np.searchsorted(values,x,'left')
+        while j > 0:
+            val = values[j-1]
+            k = np.searchsorted(values,val,'left')
+            for i in xrange(k,j):
+                if self.ends.ids[i] != exclude:
+                    return (int(self.ends.ids[i]),float(val))
+            j = k
+        return None
+    def nearest_right(self,x,exclude=None):
+        """
+        :returns: The id and start-time of the annotation starting closest after *x* or :const:`None`
+        :rtype: (:class:`int`, :class:`float`)"""
+        i = np.searchsorted(self.starts.values,x,'right')
+        while i < len(self):
+            if self.starts.ids[i] != exclude:
+                return (int(self.starts.ids[i]),float(self.starts.values[i]))
+            i += 1
+        return None
+
+class Annotations:
     """
     Provides the data model for annotations.
     It keeps track of all annotations and informs listeners if something changed.
+    The annotations are stored column-wise: start-times, end-times and interned context names are kept in
+    :mod:`numpy` arrays indexed by the annotation id, ids of removed annotations are reused.
+
+    The model is plain Python and does not need pygtk, so it can be used in worker processes and scripts.
+    Listeners are kept in a simple list per signal (see :func:`connect`); signals without listeners cost nothing.
+    :class:`gannotation.GAnnotations` makes the model available as a :class:`gobject.GObject`.
     
     +---------------------+-------------------+-------------------------+
     |Signal               | Signature         | Description             |
@@ -72,14 +253,113 @@ class Annotations(gobject.GObject):
     |                     |                   | a context that has been |
     |                     |                   | removed.                |
     +---------------------+-------------------+-------------------------+
+    |"annotations-bulk-   |                   | Called once after a     |
+    |changed"             |                   | :func:`batch` instead of|
+    |                     |                   | the single annotation   |
+    |                     |                   | signals.                |
+    +---------------------+-------------------+-------------------------+
     """
-    __metaclass__ = AnnotationsMeta
     def __init__(self):
-        gobject.GObject.__init__(self)
+        self.__handlers = dict()
+        self.__last_handler = 0
         self.__contexts = dict()
-        self.__annotations = dict()
-        self.__counter = 0
+        self.__names = []
+        self.__index = IntervalIndex()
         self.__colors = Colors()
+        self.__batch_depth = 0
+        self.__batch_dirty = False
+        self.__reset()
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_Annotations__handlers'] = dict()
+        return state
+    def connect(self,signal,cb,*args):
+        """
+        :param signal: The name of the signal
+        :type signal: :class:`str`
+        :param cb: Called with the model, the arguments of the signal and *args*
+        :type cb: :func:`callable`
+        :returns: The id of the handler
+        :rtype: :class:`int`
+
+        Registers a listener for a signal, like :func:`gobject.GObject.connect`."""
+        if signal not in SIGNALS:
+            raise TypeError("unknown signal name: "+signal)
+        self.__last_handler += 1
+        self.__handlers.setdefault(signal,[]).append((self.__last_handler,cb,args))
+        return self.__last_handler
+    def disconnect(self,handler):
+        """
+        :param handler: The id returned by :func:`connect`
+        :type handler: :class:`int`"""
+        for (signal,handlers) in self.__handlers.items():
+            handlers = [h for h in handlers if h[0] != handler]
+            if len(handlers) == 0:
+                del self.__handlers[signal]
+            else:
+                self.__handlers[signal] = handlers
+    def emit(self,signal,*args):
+        """
+        Calls all listeners of a signal."""
+        handlers = self.__handlers.get(signal)
+        if handlers is None:
+            return
+        for (handler,cb,extra) in list(handlers):
+            cb(self,*(args+extra))
+    def __reset(self):
+        self.__starts = np.empty(0)
+        self.__ends = np.empty(0)
+        self.__codes = np.empty(0,dtype=np.int32)
+        self.__size = 0
+        self.__free = []
+        self.__index.clear()
+    def __allocate(self,count):
+        """
+        Hands out *count* ids, reusing the ids of removed annotations first."""
+        keep = len(self.__free)-min(count,len(self.__free))
+        reused = self.__free[keep:]
+        del self.__free[keep:]
+        fresh = np.arange(self.__size,self.__size+count-len(reused),dtype=np.int64)
+        self.__size += len(fresh)
+        if self.__size > len(self.__codes):
+            capacity = max(self.__size,2*len(self.__codes),64)
+            grow = capacity-len(self.__codes)
+            self.__starts = np.concatenate((self.__starts,np.zeros(grow)))
+            self.__ends = np.concatenate((self.__ends,np.zeros(grow)))
+            self.__codes = np.concatenate((self.__codes,np.repeat(np.int32(-1),grow)))
+        return np.concatenate((np.array(reused[::-1],dtype=np.int64),fresh))
+    def __valid(self):
+        return np.nonzero(self.__codes[:self.__size] >= 0)[0]
+    def __code(self,id):
+        if id < 0 or id >= self.__size or self.__codes[id] < 0:
+            raise KeyError(id)
+        return self.__codes[id]
+    @contextmanager
+    def batch(self):
+        """
+        Groups many changes into one notification. Inside the block, "annotation-added",
+        "annotation-removed" and "annotation-changed" are not emitted; at its end a single
+        "annotations-bulk-changed" is emitted if any annotation changed. Batches can be nested.
+
+        .. code-block:: python
+
+           with model.batch():
+               for (ctx,boundl,boundr) in entries:
+                   model.add_annotation(ctx,boundl,boundr)
+        """
+        self.__batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.__batch_depth -= 1
+            if self.__batch_depth == 0 and self.__batch_dirty:
+                self.__batch_dirty = False
+                self.emit('annotations-bulk-changed')
+    def _notify(self,signal,*args):
+        if self.__batch_depth > 0:
+            self.__batch_dirty = True
+        elif signal in self.__handlers:
+            self.emit(signal,*args)
     def add_annotation(self,ctx,boundl,boundr):
         """
         :param ctx: The context name
@@ -92,26 +372,83 @@ class Annotations(gobject.GObject):
         :rtype: :class:`int`
         
         Adds a new annotation for the context *ctx* and the start time *boundl* and end time *boundr*. """
-        if ctx not in self.__contexts:
-            self.add_context(ctx)
-        id = self.__counter
-        self.__counter += 1
-        (color,entries) = self.__contexts[ctx]
-        self.__annotations[id] = (ctx,boundl,boundr)
-        entries.add(id)
-        self.emit('annotation-added',id,color,boundl,boundr)
+        color = self.add_context(ctx)
+        id = int(self.__allocate(1)[0])
+        self.__starts[id] = boundl
+        self.__ends[id] = boundr
+        self.__codes[id] = self.__contexts[ctx][1]
+        self.__index.add(id,boundl,boundr)
+        self._notify('annotation-added',id,color,boundl,boundr)
         return id
+    def add_annotations(self,annotations):
+        """
+        :param annotations: Context name, start-time and end-time of every new annotation
+        :type annotations: \[ (:class:`str`, :class:`float`, :class:`float`) \]
+        :returns: The ids of the new annotations
+        :rtype: \[ :class:`int` \]
+
+        Adds many annotations as one :func:`batch`. The index is sorted only once for all of them."""
+        annotations = list(annotations)
+        if len(annotations) == 0:
+            return []
+        (names,starts,ends) = zip(*annotations)
+        return self.add_columns(names,starts,ends).tolist()
+    def add_columns(self,names,starts,ends):
+        """
+        :param names: The context name of every new annotation
+        :type names: \[ :class:`str` \]
+        :param starts: The start times
+        :type starts: :class:`numpy.ndarray`
+        :param ends: The end times
+        :type ends: :class:`numpy.ndarray`
+        :returns: The ids of the new annotations
+        :rtype: :class:`numpy.ndarray`
+
+        Like :func:`add_annotations`, but takes one sequence per column."""
+        starts = np.asarray(starts,dtype=float)
+        ends = np.asarray(ends,dtype=float)
+        if len(starts) == 0:
+            return np.empty(0,dtype=np.int64)
+        with self.batch():
+            (uniq,first,inverse) = np.unique(np.asarray(names),return_index=True,return_inverse=True)
+            uniq = uniq.tolist()
+            for i in np.argsort(first,kind='mergesort'):
+                self.add_context(uniq[i])
+            codes = np.array([self.__contexts[name][1] for name in uniq],dtype=np.int32)
+            ids = self.__allocate(len(starts))
+            self.__starts[ids] = starts
+            self.__ends[ids] = ends
+            self.__codes[ids] = codes[inverse]
+            self.__index.add_many(ids,starts,ends)
+            self.__batch_dirty = True
+        return ids
     def remove_annotation(self,id):
         """
         :param id: The id of the annotation to be removed
         :type id: :class:`int`
         
         Removes an annotation from the model. """
-        (ctx,boundl,boundr) = self.__annotations[id]
-        (color,entries) = self.__contexts[ctx]
-        entries.remove(id)
-        del self.__annotations[id]
-        self.emit('annotation-removed',id)
+        self.__code(id)
+        self.__codes[id] = -1
+        self.__free.append(int(id))
+        self.__index.remove(id,self.__starts[id],self.__ends[id])
+        self._notify('annotation-removed',id)
+    def remove_annotations(self,ids):
+        """
+        :param ids: The ids of the annotations to be removed
+        :type ids: \[ :class:`int` \]
+
+        Removes many annotations as one :func:`batch`."""
+        ids = np.unique(np.asarray(ids,dtype=np.int64))
+        if len(ids) == 0:
+            return
+        if ids[0] < 0 or ids[-1] >= self.__size or (self.__codes[ids] < 0).any():
+            raise KeyError(ids)
+        with self.batch():
+            self.__codes[ids] = -1
+            self.__free.extend(ids.tolist())
+            self.__index.remove_many(ids)
+            self.__batch_dirty = True
     def add_context(self,ctx):
         """
         :param ctx: Name of the new context
@@ -124,11 +461,17 @@ class Annotations(gobject.GObject):
             color = self.free_color()
             if color is None:
                 raise "HALP! I CAN'T HAZ COLOR"
-            self.__contexts[ctx] = (color,set())
+            if None in self.__names:
+                code = self.__names.index(None)
+                self.__names[code] = ctx
+            else:
+                code = len(self.__names)
+                self.__names.append(ctx)
+            self.__contexts[ctx] = (color,code)
             self.emit('context-added',ctx,color)
             return color
         else:
-            (color,entries) = self.__contexts[ctx]
+            (color,code) = self.__contexts[ctx]
             return color
     def free_color(self):
         return rgb2hex(self.__colors.next())
@@ -140,12 +483,11 @@ class Annotations(gobject.GObject):
         Removes a context from the model. The color used by the context becomes available to new contexts. """
         if ctx not in self.__contexts:
             return
-        (color,entries) = self.__contexts[ctx]
-        for id in entries:
-            del self.__annotations[id]
-            self.emit('annotation-removed',id)
+        (color,code) = self.__contexts[ctx]
+        self.remove_annotations(np.nonzero(self.__codes[:self.__size] == code)[0])
         self.emit('context-removed',ctx)
         del self.__contexts[ctx]
+        self.__names[code] = None
     def find_annotation(self,x):
         """
         :param x: The time where to search
@@ -154,55 +496,63 @@ class Annotations(gobject.GObject):
         :rtype: \[ :class:`int` \]
 
         Finds all annotations that include a given timestamp. If the timestamp lies within no annotation, it returns :const:`[]`."""
-        hits = []
-        for (id,(ctx,boundl,boundr)) in self.__annotations.iteritems():
-            if x>=boundl and x<=boundr:
-                hits.append(id)
-        return hits
+        return self.__index.find(x)
+    def find_range(self,boundl,boundr):
+        """
+        :param boundl: The start of the time range
+        :type boundl: :class:`float`
+        :param boundr: The end of the time range
+        :type boundr: :class:`float`
+        :returns: A list of all annotations that intersect the time range
+        :rtype: \[ :class:`int` \]
+
+        Finds all annotations that lie at least partially within a time range."""
+        return self.__index.overlapping(boundl,boundr)
     def get_annotation(self,id):
         """
         :param id: The id of the annotation
         :type id: :class:`int`
         :returns: Context name, color, start-time and end-time of the annotation
         :rtype: (:class:`str`, :class:`str`, :class:`float`, :class:`float`)"""
-        (ctx,boundl,boundr) = self.__annotations[id]
-        (color,entries) = self.__contexts[ctx]
-        return (ctx,color,boundl,boundr)
+        ctx = self.__names[self.__code(id)]
+        (color,code) = self.__contexts[ctx]
+        return (ctx,color,float(self.__starts[id]),float(self.__ends[id]))
     def contexts(self):
         """
         :returns: An iterator over name and colors of all contexts in the model
         :rtype: :class:`iterator`"""
-        return((name,color) for name,(color,entries) in self.__contexts.iteritems())
+        return((name,color) for name,(color,code) in self.__contexts.iteritems())
     def annotations(self):
         """
         :returns: An iterator over id, color, start-time and end-time of all annotations in the model.
         :rtype: :class:`iterator`"""
-        return((id,self.__contexts[ctx][0],boundl,boundr) for (id,(ctx,boundl,boundr)) in self.__annotations.iteritems())
+        ids = self.__valid()
+        colors = [None if name is None else self.__contexts[name][0] for name in self.__names]
+        return((id,colors[code],boundl,boundr) for (id,code,boundl,boundr)
+               in zip(ids.tolist(),self.__codes[ids].tolist(),self.__starts[ids].tolist(),self.__ends[ids].tolist()))
     def __iter__(self):
-        return self.__annotations.itervalues()
+        (names,starts,ends) = self.columns()
+        return iter(zip(names,starts.tolist(),ends.tolist()))
+    def __len__(self):
+        return len(self.__index)
     def bounds(self):
         """
         :rtype: (:class:`float`, :class:`float`)
         
-        Calculate the minimal start-time and maximal end-time of all annotations."""
-        l = None
-        r = None
-        for (ctx,boundl,boundr) in self.__annotations.itervalues():
-            if l is None or boundl < l:
-                l = boundl
-            if r is None or boundr > r:
-                r = boundr
-        return (l,r)
+        Calculate the minimal start-time and maximal end-time of all annotations.
+        Both are read from the ends of the sorted index, so this takes constant time."""
+        return self.__index.bounds()
     def clear(self):
         """
         Removes all annotations and contexts from the model. """
-        for i in self.__annotations:
-            self.emit('annotation-removed',i)
+        with self.batch():
+            if len(self.__index) > 0:
+                self.__batch_dirty = True
+            self.__reset()
         for c in self.__contexts:
             self.emit('context-removed',c)
-        self.__annotations = dict()
         self.__contexts = dict()
-        self.__counter = 0
+        self.__names = []
     def find_boundings(self,x,exclude=None):
         """
         :param x: The x-position
@@ -214,16 +564,7 @@ class Annotations(gobject.GObject):
         
         Given a x-position, it finds the two annotations nearest to the position on the left and right.
         """
-        curl = None
-        curr = None
-        for (id,(ctx,boundl,boundr)) in self.__annotations.iteritems():
-            if id is exclude:
-                continue
-            if boundl > x and (curr is None or curr[1] > boundl):
-                curr = (id,boundl)
-            if boundr < x and (curl is None or curl[1] < boundr):
-                curl = (id,boundr)
-        return (curl,curr)
+        return (self.__index.nearest_left(x,exclude),self.__index.nearest_right(x,exclude))
     def update_annotation(self,id,boundl,boundr):
         """
         :param id: The id of the annotation
@@ -234,10 +575,27 @@ class Annotations(gobject.GObject):
         :type boundr: :class:`float`
 
         Changes an annotation to new time-bounds. """
-        (ctx,oldl,oldr) = self.__annotations[id]
-        self.__annotations[id] = (ctx,boundl,boundr)
-        (color,entries) = self.__contexts[ctx]
-        self.emit('annotation-changed',id,ctx,color,boundl,boundr)
+        ctx = self.__names[self.__code(id)]
+        self.__index.remove(id,self.__starts[id],self.__ends[id])
+        self.__starts[id] = boundl
+        self.__ends[id] = boundr
+        self.__index.add(id,boundl,boundr)
+        (color,code) = self.__contexts[ctx]
+        self._notify('annotation-changed',id,ctx,color,boundl,boundr)
+    def columns(self,ctx=None):
+        """
+        :param ctx: Only return the annotations of this context, or :const:`None` for all
+        :type ctx: :class:`str`
+        :returns: The context names, start-times and end-times of the annotations, ordered by id
+        :rtype: (\[ :class:`str` \], :class:`numpy.ndarray`, :class:`numpy.ndarray`)"""
+        if ctx is None:
+            ids = self.__valid()
+        elif ctx in self.__contexts:
+            ids = np.nonzero(self.__codes[:self.__size] == self.__contexts[ctx][1])[0]
+        else:
+            ids = np.empty(0,dtype=np.int64)
+        names = np.array(self.__names,dtype=object)[self.__codes[ids]].tolist()
+        return (names,self.__starts[ids],self.__ends[ids])
     def write(self,fn):
         """
         :param fn: The filename to write to
@@ -248,36 +606,34 @@ class Annotations(gobject.GObject):
         <context-name> <start-time> <end-time>
         
         The timestamps are seconds since 1.1.1970 (UNIX timestamps)"""
-        utc = UTC()
+        (names,starts,ends) = self.columns()
+        starts = num2unix(starts)
+        ends = num2unix(ends)
         with open(fn,'w') as h:
-            for (ctx,boundl,boundr) in self.__annotations.itervalues():
-                h.write(ctx+" "+str(calendar.timegm(num2date(boundl,utc).utctimetuple()))+" "
-                        +str(calendar.timegm(num2date(boundr,utc).utctimetuple()))+"\n")
+            h.write("".join("%s %d %d\n" % row for row in zip(names,starts,ends)))
     def read(self,fn):
         """
         :param fn: The filename from which to read
         :type fn: string
 
-        The inverse of :func:`write`."""
+        The inverse of :func:`write`. The whole file is parsed at once and added with :func:`add_annotations`."""
+        with self.batch():
+            self.__read(fn)
+    def __read(self,fn):
         self.clear()
-        utc = UTC()
         with open(fn,'r') as h:
-            c = 0
-            for ln in h:
-                c += 1
-                words = ln.split()
-                if len(words) is not 3:
-                    raise IOError("Line "+str(c)+" of "+fn+" has "+str(len(words))+" columns (must have 3)")
-                (name,start,end) = ln.split()
-                try:
-                    tstart = date2num(datetime.datetime.utcfromtimestamp(float(start)))
-                    tend = date2num(datetime.datetime.utcfromtimestamp(float(end)))
-                except ValueError:
-                    raise IOError("Line "+str(c)+" of "+fn+" contains invalid timestamps")
-                
-                self.add_annotation(name,tstart,tend)
-
-    #def export(self,fn,sources,cb=None,end_cb=None):
-    #    writer = ExportWriter(fn,sources,self.__annotations,cb,end_cb)
-    #    write_thread = threading.Thread(target=writer,name="export thread")
-    #    write_thread.start()
+            rows = [ln.split() for ln in h]
+        for (c,words) in enumerate(rows):
+            if len(words) != 3:
+                raise IOError("Line "+str(c+1)+" of "+fn+" has "+str(len(words))+" columns (must have 3)")
+        if len(rows) == 0:
+            return
+        table = np.array(rows)
+        try:
+            secs = table[:,1:].astype(float)
+        except ValueError:
+            secs = None
+        if secs is None or not np.isfinite(secs).all():
+            secs = np.array([_parse_timestamps(fn,c+1,start,end) for (c,(name,start,end)) in enumerate(rows)])
+        nums = unix2num(secs)
+        self.add_columns(table[:,0].tolist(),nums[:,0],nums[:,1])
@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- coding: utf-8
+
+"""
+Batch processing
+================
+
+A command line interface to convert, merge, validate and summarize many annotation files at once,
+without a display. Every input can be an annotation package, a file with one annotation per line
+(see :func:`annotation.Annotations.write`) or any file :func:`annpkg.importer.import_file` understands.
+
+.. code-block:: sh
+
+   python batch.py summarize -j 8 recordings/*.tar
+   python batch.py convert --format text -o out/ recordings/*.tar
+   python batch.py merge -o all.tar recordings/*.tar
+   python batch.py validate recordings/*.tar
+   python batch.py features -w 1.0 -o out/ recordings/*.tar
+"""
+
+import os
+import sys
+import tarfile
+import argparse
+import multiprocessing
+import gettext
+import numpy as np
+
+gettext.install('context-annotator','po')
+
+from annotation import Annotations
+import features
+from annpkg.model import AnnPkg
+from annpkg.importer import import_file
+
+def load(fn):
+    """
+    :param fn: The name of the file
+    :type fn: :class:`str`
+    :returns: The annotations and the sources of the file
+    :rtype: (:class:`annotation.Annotations`, \[ :class:`sources.Source` \])
+
+    Reads a package, an annotation file or an importable file."""
+    model = Annotations()
+    if tarfile.is_tarfile(fn):
+        pkg = AnnPkg.load(fn)
+    else:
+        try:
+            model.read(fn)
+            return (model,[])
+        except IOError:
+            pkg = import_file(fn)
+    model.add_annotations(pkg.annotations)
+    return (model,[src for (src,anns) in pkg.sources if src is not None])
+
+def save(fn,model,sources,format):
+    """
+    :param format: ``package`` or ``text``
+    :type format: :class:`str`
+
+    Writes annotations and sources to a package or only the annotations to a text file."""
+    if format == 'package':
+        pkg = AnnPkg([(src,None) for src in sources],list(model))
+        pkg.write(fn)
+    else:
+        model.write(fn)
+
+def summarize(fn):
+    """
+    :returns: The name of the file, the number of annotations and their total length in seconds for every context
+              and the error if the file could not be read
+    :rtype: (:class:`str`, :class:`dict`, :class:`str`)"""
+    try:
+        (model,sources) = load(fn)
+    except Exception as e:
+        return (fn,dict(),str(e))
+    (names,starts,ends) = model.columns()
+    stats = dict()
+    names = np.asarray(names)
+    for ctx in np.unique(names).tolist():
+        mask = names == ctx
+        stats[ctx] = (int(mask.sum()),float((ends[mask]-starts[mask]).sum()*86400.0))
+    return (fn,stats,None)
+
+def validate(fn):
+    """
+    :returns: The name of the file and a list of the problems found
+    :rtype: (:class:`str`, \[ :class:`str` \])
+
+    Checks that all timestamps are valid, every annotation ends after it starts and that
+    annotations of the same context do not overlap."""
+    try:
+        (model,sources) = load(fn)
+    except Exception as e:
+        return (fn,[str(e)])
+    problems = []
+    (names,starts,ends) = model.columns()
+    names = np.asarray(names)
+    bad = ~(np.isfinite(starts) & np.isfinite(ends))
+    if bad.any():
+        problems.append("%d annotations with invalid timestamps" % bad.sum())
+    bad = ends <= starts
+    if bad.any():
+        problems.append("%d annotations that do not end after they start" % bad.sum())
+    for ctx in np.unique(names).tolist():
+        mask = names == ctx
+        order = np.argsort(starts[mask],kind='mergesort')
+        s = starts[mask][order]
+        e = np.maximum.accumulate(ends[mask][order])
+        overlaps = (s[1:] < e[:-1]).sum()
+        if overlaps > 0:
+            problems.append("%d overlapping annotations of context %s" % (overlaps,ctx))
+    return (fn,problems)
+
+def convert(job):
+    """
+    :param job: The name of the input file, the name of the output file and the output format
+    :type job: (:class:`str`, :class:`str`, :class:`str`)
+    :returns: The name of the input file, the name of the output file and the error if the file could not be converted
+    :rtype: (:class:`str`, :class:`str`, :class:`str`)"""
+    (fn,target,format) = job
+    try:
+        (model,sources) = load(fn)
+        save(target,model,sources,format)
+    except Exception as e:
+        return (fn,target,str(e))
+    return (fn,target,None)
+
+def export_features(job):
+    """
+    :param job: The name of the input file, the output directory and the length of a window in seconds
+    :type job: (:class:`str`, :class:`str`, :class:`float`)
+    :returns: The name of the input file, the names of the written files (one per source) and the error if the file could not be read
+    :rtype: (:class:`str`, \[ :class:`str` \], :class:`str`)
+
+    Writes the features of every source of a file (see :func:`features.compute`), one line per window.
+    The features are taken from the cache next to the package if they have been computed before."""
+    (fn,target,window) = job
+    try:
+        (model,sources) = load(fn)
+    except Exception as e:
+        return (fn,[],str(e))
+    directory = features.cache_dir(fn) if tarfile.is_tarfile(fn) else None
+    names = []
+    for (i,src) in enumerate(sources):
+        feats = features.features(src,window,directory)
+        channels = feats['mean'].shape[1]
+        columns = [feats['time'].reshape((-1,1))]+[feats[name] for name in features.FEATURES]
+        header = "time\t"+"\t".join("%s%d" % (name,c+1) for name in features.FEATURES for c in range(channels))
+        out = os.path.join(target,"%s-%d.txt" % (os.path.splitext(os.path.basename(fn))[0],i+1))
+        np.savetxt(out,np.hstack(columns),delimiter="\t",header=header,comments='# ')
+        names.append(out)
+    return (fn,names,None)
+
+def read_columns(fn):
+    """
+    :returns: The name of the file, the columns of its annotations (see :func:`annotation.Annotations.columns`)
+              and the error if the file could not be read
+    :rtype: (:class:`str`, (\[ :class:`str` \], :class:`numpy.ndarray`, :class:`numpy.ndarray`), :class:`str`)"""
+    try:
+        (model,sources) = load(fn)
+    except Exception as e:
+        return (fn,None,str(e))
+    return (fn,model.columns(),None)
+
+def report(fn,error):
+    sys.stderr.write("%s: %s\n" % (fn,error))
+
+def run_convert(args,pool):
+    ext = {'package':'.tar','text':'.txt'}[args.format]
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    jobs = [(fn,os.path.join(args.output,os.path.splitext(os.path.basename(fn))[0]+ext),args.format) for fn in args.files]
+    failed = 0
+    for (fn,target,error) in pool.imap(convert,jobs):
+        if error is None:
+            print target
+        else:
+            failed += 1
+            report(fn,error)
+    return 1 if failed > 0 else 0
+
+def run_merge(args,pool):
+    model = Annotations()
+    sources = []
+    failed = 0
+    if args.format == 'package':
+        # sources can't be passed between processes, so packages are merged in this one
+        for fn in args.files:
+            try:
+                (m,srcs) = load(fn)
+            except Exception as e:
+                failed += 1
+                report(fn,e)
+                continue
+            model.add_columns(*m.columns())
+            sources.extend(srcs)
+    else:
+        for (fn,columns,error) in pool.imap(read_columns,args.files):
+            if error is None:
+                model.add_columns(*columns)
+            else:
+                failed += 1
+                report(fn,error)
+    save(args.output,model,sources,args.format)
+    print "%s: %d annotations" % (args.output,len(model))
+    return 1 if failed > 0 else 0
+
+def run_validate(args,pool):
+    failed = 0
+    for (fn,problems) in pool.imap(validate,args.files):
+        if len(problems) == 0:
+            print "%s: OK" % fn
+        else:
+            failed += 1
+            for p in problems:
+                print "%s: %s" % (fn,p)
+    return 1 if failed > 0 else 0
+
+def run_features(args,pool):
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    jobs = [(fn,args.output,args.window) for fn in args.files]
+    failed = 0
+    for (fn,names,error) in pool.imap(export_features,jobs):
+        if error is not None:
+            failed += 1
+            report(fn,error)
+        for name in names:
+            print name
+    return 1 if failed > 0 else 0
+
+def run_summarize(args,pool):
+    total = dict()
+    failed = 0
+    for (fn,stats,error) in pool.imap(summarize,args.files):
+        if error is not None:
+            failed += 1
+            report(fn,error)
+        for (ctx,(count,length)) in sorted(stats.iteritems()):
+            print "%s\t%s\t%d\t%.3f" % (fn,ctx,count,length)
+            (tcount,tlength) = total.get(ctx,(0,0.0))
+            total[ctx] = (tcount+count,tlength+length)
+    if len(args.files) > 1:
+        for (ctx,(count,length)) in sorted(total.iteritems()):
+            print "%s\t%s\t%d\t%.3f" % ("*",ctx,count,length)
+    return 1 if failed > 0 else 0
+
+def parser():
+    """
+    :rtype: :class:`argparse.ArgumentParser`"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-j','--jobs',type=int,default=multiprocessing.cpu_count(),
+                        help=_("number of worker processes (default: one per core)"))
+    p = argparse.ArgumentParser(description=_("Processes annotation files without a display."))
+    sub = p.add_subparsers(dest='command')
+    c = sub.add_parser('convert',parents=[common],help=_("convert files into packages or annotation files"))
+    c.add_argument('-o','--output',required=True,help=_("output directory"))
+    c.add_argument('-f','--format',choices=['package','text'],default='package')
+    c.add_argument('files',nargs='+')
+    m = sub.add_parser('merge',parents=[common],help=_("merge the annotations (and sources) of many files into one"))
+    m.add_argument('-o','--output',required=True,help=_("output file"))
+    m.add_argument('-f','--format',choices=['package','text'],default='package')
+    m.add_argument('files',nargs='+')
+    v = sub.add_parser('validate',parents=[common],help=_("check annotations for invalid or overlapping entries"))
+    v.add_argument('files',nargs='+')
+    s = sub.add_parser('summarize',parents=[common],help=_("print number and total length in seconds of the annotations of every context"))
+    s.add_argument('files',nargs='+')
+    f = sub.add_parser('features',parents=[common],help=_("write the windowed features of every source"))
+    f.add_argument('-o','--output',required=True,help=_("output directory"))
+    f.add_argument('-w','--window',type=float,default=1.0,help=_("length of a window in seconds"))
+    f.add_argument('files',nargs='+')
+    return p
+
+def main(argv):
+    args = parser().parse_args(argv)
+    commands = {'convert':run_convert,
+                'merge':run_merge,
+                'validate':run_validate,
+                'summarize':run_summarize,
+                'features':run_features}
+    pool = multiprocessing.Pool(max(1,args.jobs))
+    try:
+        return commands[args.command](args,pool)
+    finally:
+        pool.close()
+        pool.join()
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
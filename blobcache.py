@@ -0,0 +1,334 @@
+"""
+The source cache
+================
+
+Keeps the timestamps and samples of the sources of annotation packages in memory-mappable files,
+and remembers which sources a package holds. A package whose sources are known to be unchanged
+is saved by replacing only its annotations (see :func:`rewrite_annotations`).
+"""
+import os
+import shutil
+import tarfile
+import hashlib
+import tempfile
+import threading
+import weakref
+import numpy as np
+from memmapsource import CACHE_DIR
+
+BLOB_DIR = os.path.join(CACHE_DIR,'blobs')
+MANIFEST_DIR = os.path.join(CACHE_DIR,'packages')
+HASH_BLOCK = 1024*1024
+MAX_CACHE_SIZE = 4*1024*1024*1024
+
+_digests = weakref.WeakKeyDictionary()
+
+def _hash_array(h,arr):
+    arr = np.asarray(arr)
+    h.update(str(arr.dtype)+str(arr.shape))
+    rows = max(1,HASH_BLOCK//max(1,arr[:1].nbytes))
+    for i in xrange(0,len(arr),rows):
+        h.update(np.ascontiguousarray(arr[i:i+rows]).tostring())
+
+def source_digest(src):
+    """
+    :param src: The source
+    :type src: :class:`sources.Source`
+    :returns: A hash of the timestamps and samples of the source
+    :rtype: :class:`str`
+
+    The digest is computed once per source object and then remembered."""
+    try:
+        return _digests[src]
+    except (KeyError,TypeError):
+        pass
+    h = hashlib.sha1()
+    _hash_array(h,src.get_time(True))
+    _hash_array(h,src.get_data(True))
+    digest = h.hexdigest()
+    try:
+        _digests[src] = digest
+    except TypeError:
+        pass
+    return digest
+
+def _package_stamp(fn):
+    st = os.stat(fn)
+    return "%s\t%d\t%r" % (os.path.abspath(fn),st.st_size,st.st_mtime)
+
+def manifest_file(fn):
+    """
+    :param fn: The name of an annotation package
+    :type fn: :class:`str`
+    :returns: The name of the file listing the sources of the package
+    :rtype: :class:`str`"""
+    return os.path.join(MANIFEST_DIR,hashlib.sha1(os.path.abspath(fn)).hexdigest()+'.manifest')
+
+def blob_files(digest):
+    """
+    :returns: The names of the files holding the timestamps and samples of a source
+    :rtype: (:class:`str`, :class:`str`)"""
+    base = os.path.join(BLOB_DIR,digest)
+    return (base+'-time.npy',base+'-data.npy')
+
+class CachedSource(object):
+    """
+    :param src: The source as loaded from the package
+    :type src: :class:`sources.Source`
+    :param digest: The digest of the source
+    :type digest: :class:`str`
+    :param time_bounds: The time bounds of the source
+    :type time_bounds: (:class:`float`, :class:`float`)
+    :param data_bounds: The data bounds of the source
+    :type data_bounds: (:class:`float`, :class:`float`)
+
+    Serves timestamps and samples of a source from memory-mapped cache files instead of decoding them from the package.
+    Everything else is passed on to the original source.
+    """
+    def __init__(self,src,digest,time_bounds,data_bounds):
+        self.original = src
+        self.time_bounds = time_bounds
+        self.data_bounds = data_bounds
+        (time_fn,data_fn) = blob_files(digest)
+        self.times = np.load(time_fn,mmap_mode='r')
+        self.data = np.load(data_fn,mmap_mode='r')
+        _digests[self] = digest
+    def __getattr__(self,name):
+        return getattr(self.original,name)
+    def get_time(self,cached=True):
+        return self.times
+    def get_data(self,cached=True):
+        return self.data
+    def get_time_bounds(self):
+        return self.time_bounds
+    def get_data_bounds(self):
+        return self.data_bounds
+
+def _replace(fn,write):
+    (fd,tmp) = tempfile.mkstemp(suffix='.tmp',prefix=os.path.basename(fn)+'.',dir=os.path.dirname(fn) or '.')
+    try:
+        with os.fdopen(fd,'wb') as h:
+            write(h)
+        os.rename(tmp,fn)
+    except:
+        os.remove(tmp)
+        raise
+
+def original(src):
+    """
+    :returns: The source as it has to be written to a package
+    :rtype: :class:`sources.Source`"""
+    if isinstance(src,CachedSource):
+        return src.original
+    return src
+
+def store(fn,sources):
+    """
+    :param fn: The name of the annotation package that has just been written
+    :type fn: :class:`str`
+    :param sources: The sources of the package
+    :type sources: \[ :class:`sources.Source` \]
+
+    Puts the timestamps and samples of all sources into the cache, unless they are there already,
+    and remembers which sources the package contains. Hashes and copies every source, so it should
+    run in the background (see :class:`CacheWriter`)."""
+    for dn in (BLOB_DIR,MANIFEST_DIR):
+        try:
+            os.makedirs(dn)
+        except OSError:
+            if not os.path.isdir(dn):
+                raise
+    lines = [_package_stamp(fn)]
+    for src in sources:
+        digest = source_digest(src)
+        for (bfn,arr) in zip(blob_files(digest),(src.get_time(True),src.get_data(True))):
+            if not os.path.exists(bfn):
+                _replace(bfn,lambda h: np.save(h,np.asarray(arr)))
+        lines.append("\t".join([digest]+[repr(float(x)) for x in list(src.get_time_bounds())+list(src.get_data_bounds())]))
+    _replace(manifest_file(fn),lambda h: h.write("\n".join(lines)+"\n"))
+
+def evict(limit=MAX_CACHE_SIZE):
+    """
+    :param limit: The size the blobs may take up in bytes
+    :type limit: :class:`int`
+
+    Removes the sources that have not been used for the longest time until the cache is smaller than *limit*.
+    Packages whose sources are gone are simply read from the package again."""
+    if not os.path.isdir(BLOB_DIR):
+        return
+    blobs = dict()
+    for name in os.listdir(BLOB_DIR):
+        if not name.endswith('.npy'):
+            continue
+        try:
+            st = os.stat(os.path.join(BLOB_DIR,name))
+        except OSError:
+            continue
+        digest = name.rsplit('-',1)[0]
+        (size,used) = blobs.get(digest,(0,0.0))
+        blobs[digest] = (size+st.st_size,max(used,st.st_mtime))
+    total = sum(size for (size,used) in blobs.itervalues())
+    for (used,digest) in sorted((used,digest) for (digest,(size,used)) in blobs.iteritems()):
+        if total <= limit:
+            break
+        for bfn in blob_files(digest):
+            try:
+                os.remove(bfn)
+            except OSError:
+                pass
+        total -= blobs[digest][0]
+
+class CacheWriter(threading.Thread):
+    """
+    :param fn: The name of the annotation package
+    :type fn: :class:`str`
+    :param sources: The sources of the package
+    :type sources: \[ :class:`sources.Source` \]
+
+    Stores the sources of a package (see :func:`store`) and then shrinks the cache (see :func:`evict`) in a background thread.
+    Failures only cost the cache, never the package, so they are ignored.
+    """
+    def __init__(self,fn,sources):
+        threading.Thread.__init__(self,name="cache writer thread")
+        self.daemon = True
+        self.fn = fn
+        self.sources = list(sources)
+    def run(self):
+        try:
+            store(self.fn,self.sources)
+            evict()
+        except (IOError,OSError):
+            pass
+
+def _manifest(fn):
+    mfn = manifest_file(fn)
+    if not os.path.exists(mfn):
+        return None
+    with open(mfn,'rb') as h:
+        lines = h.read().splitlines()
+    if len(lines) == 0 or lines[0] != _package_stamp(fn):
+        return None
+    entries = []
+    for ln in lines[1:]:
+        fields = ln.split('\t')
+        (tl,tr,dl,dr) = [float(x) for x in fields[1:5]]
+        entries.append((fields[0],(tl,tr),(dl,dr)))
+    return entries
+
+def restore(fn,sources):
+    """
+    :param fn: The name of an annotation package that has just been loaded
+    :type fn: :class:`str`
+    :param sources: The sources of the package
+    :type sources: \[ :class:`sources.Source` \]
+    :returns: The sources, served from the cache where possible
+    :rtype: \[ :class:`sources.Source` \]
+
+    Replaces the sources of a package by their cached copies, if the package hasn't changed since it was stored."""
+    entries = _manifest(fn)
+    if entries is None or len(entries) != len(sources):
+        return sources
+    res = []
+    for (src,(digest,time_bounds,data_bounds)) in zip(sources,entries):
+        try:
+            for bfn in blob_files(digest):
+                os.utime(bfn,None)
+            res.append(CachedSource(src,digest,time_bounds,data_bounds))
+        except (IOError,OSError):
+            res.append(src)
+    return res
+
+def unchanged(fn,sources):
+    """
+    :param fn: The name of an annotation package
+    :type fn: :class:`str`
+    :param sources: The sources that are to be saved to the package
+    :type sources: \[ :class:`sources.Source` \]
+    :returns: Whether the package holds exactly these sources
+    :rtype: :class:`bool`
+
+    Only looks at digests that are known already, a source that hasn't been hashed yet counts as changed."""
+    try:
+        entries = _manifest(fn)
+    except (IOError,OSError):
+        return False
+    if entries is None or len(entries) != len(sources):
+        return False
+    for (src,(digest,time_bounds,data_bounds)) in zip(sources,entries):
+        try:
+            if _digests.get(src) != digest:
+                return False
+        except TypeError:
+            return False
+    return True
+
+def _tar_mode(fn):
+    with open(fn,'rb') as h:
+        magic = h.read(3)
+    if magic[:2] == '\x1f\x8b':
+        return 'w:gz'
+    elif magic == 'BZh':
+        return 'w:bz2'
+    return 'w'
+
+def rewrite_annotations(fn,sources,annotations):
+    """
+    :param fn: The name of an annotation package
+    :type fn: :class:`str`
+    :param sources: The sources that are to be saved to the package
+    :type sources: \[ :class:`sources.Source` \]
+    :param annotations: The annotations to save
+    :type annotations: \[ (:class:`str`, :class:`float`, :class:`float`) \]
+    :returns: Whether the package was saved, if not it has to be written as a whole
+    :rtype: :class:`bool`
+
+    Replaces the annotations of a package whose sources are unchanged (see :func:`unchanged`) without decoding
+    or encoding its sources. The members of a package that holds only the annotations take the place of the
+    members of the same name, all other members are copied byte for byte. The result is only used if it
+    loads with all sources and annotations."""
+    from annpkg.model import AnnPkg
+    if not unchanged(fn,sources):
+        return False
+    annotations = list(annotations)
+    directory = os.path.dirname(fn) or '.'
+    (fd,ann_fn) = tempfile.mkstemp(suffix='.tar',prefix=os.path.basename(fn)+'.',dir=directory)
+    os.close(fd)
+    (fd,tmp) = tempfile.mkstemp(suffix='.tmp',prefix=os.path.basename(fn)+'.',dir=directory)
+    os.close(fd)
+    try:
+        AnnPkg([],annotations).write(ann_fn)
+        new = tarfile.open(ann_fn,'r:*')
+        old = tarfile.open(fn,'r:*')
+        try:
+            replaced = dict((info.name,info) for info in new.getmembers())
+            out = tarfile.open(tmp,_tar_mode(fn))
+            try:
+                for info in old.getmembers():
+                    if info.name in replaced:
+                        info = replaced.pop(info.name)
+                        out.addfile(info,new.extractfile(info) if info.isfile() else None)
+                    else:
+                        out.addfile(info,old.extractfile(info) if info.isfile() else None)
+                for info in new.getmembers():
+                    if info.name in replaced:
+                        out.addfile(info,new.extractfile(info) if info.isfile() else None)
+            finally:
+                out.close()
+        finally:
+            old.close()
+            new.close()
+        pkg = AnnPkg.load(tmp)
+        if len([src for (src,anns) in pkg.sources if src is not None]) != len(sources) or len(pkg.annotations) != len(annotations):
+            return False
+        shutil.copymode(fn,tmp)
+        os.rename(tmp,fn)
+    finally:
+        for name in (ann_fn,tmp):
+            if os.path.exists(name):
+                os.remove(name)
+    mfn = manifest_file(fn)
+    with open(mfn,'rb') as h:
+        lines = h.read().splitlines()
+    lines[0] = _package_stamp(fn)
+    _replace(mfn,lambda h: h.write("\n".join(lines)+"\n"))
+    return True
@@ -4,8 +4,15 @@ The display component
 """
 import gobject
 import gtk
+import time
 from matplotlib.figure import Figure
+from matplotlib.gridspec import GridSpec
+from matplotlib.lines import Line2D
+from matplotlib.transforms import blended_transform_factory
+import numpy as np
 from matplotlib.backends.backend_gtkagg import FigureCanvasGTKAgg as FigureCanvas
+from lod import DecimationPyramid,WindowCache
+from spanlayer import SpanLayer
 
 class DisplayMeta(gobject.GObjectMeta):
     def __init__(cls,*kwds):
@@ -15,8 +22,96 @@ class DisplayMeta(gobject.GObjectMeta):
                            gobject.SIGNAL_RUN_FIRST,
                            gobject.TYPE_NONE,
                            (gobject.TYPE_DOUBLE,gobject.TYPE_DOUBLE))
+        gobject.signal_new('zoom-request', cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_DOUBLE,gobject.TYPE_INT))
         gobject.type_register(cls)
 
+class Track:
+    """
+    :param display: The display the track belongs to
+    :type display: :class:`Display`
+    :param axes: The axes on which the data is plotted
+    :type axes: :class:`matplotlib.axes.Axes`
+    :param src: The data-source to be displayed
+    :type src: :class:`sources.Source`
+    :param pyramid: The level of detail summaries of the source if they have been built already
+    :type pyramid: :class:`lod.DecimationPyramid`
+
+    One data-source of a :class:`Display`, plotted on its own axes.
+    Sources that have a ``get_range(start,end,max_points)`` method are asked for the visible window only,
+    for all other sources a :class:`lod.DecimationPyramid` of the whole series is built.
+
+    .. attribute:: src
+
+       The displayed data-source.
+
+    .. attribute:: feature_line
+
+       The line of the feature shown over the data, see :func:`set_features`.
+    """
+    def __init__(self,display,axes,src,pyramid=None):
+        self.display = display
+        self.axes = axes
+        self.feature_line = None
+        self.features = None
+        self.set_source(src,pyramid)
+        xb = src.get_time_bounds()
+        (times,data) = self.windows.fetch(xb[0],xb[0],2)
+        self.lines = axes.plot_date(times,data,'-')
+    def set_source(self,src,pyramid=None):
+        """
+        :param src: The new data-source
+        :type src: :class:`sources.Source`
+
+        Replaces the displayed data-source by one with the same channels, e.g. by a bigger part of a source that is still being loaded.
+        The plotted data is replaced by the next :func:`Display.update_lines`."""
+        self.src = src
+        if hasattr(src,'get_range'):
+            fetch = src.get_range
+        else:
+            if pyramid is None:
+                pyramid = DecimationPyramid(src.get_time(True),src.get_data(True))
+            fetch = pyramid.window
+        self.pyramid = pyramid
+        self.windows = WindowCache(fetch,self.display.cache_size,self.display.read_ahead)
+        self.axes.set_ybound(src.get_data_bounds())
+    def set_features(self,times,values):
+        """
+        :param times: The start of every feature window or :const:`None` to remove the feature
+        :type times: :class:`numpy.ndarray`
+        :param values: The feature of every window, one column per channel
+        :type values: :class:`numpy.ndarray`
+
+        Shows a feature (see :func:`features.compute`) over the data, averaged over all channels and scaled to the height of the track."""
+        if self.feature_line is not None:
+            self.feature_line.remove()
+            self.feature_line = None
+            self.features = None
+        if times is None:
+            return
+        if values.ndim == 2:
+            with np.errstate(invalid='ignore'):
+                values = np.mean(values,axis=1)
+        valid = np.isfinite(values)
+        top = np.abs(values[valid]).max() if valid.any() else 0
+        if top > 0:
+            values = values/top
+        self.features = (times,values)
+        self.feature_line = Line2D([],[],color='k',alpha=0.6,drawstyle='steps-post',
+                                   transform=blended_transform_factory(self.axes.transData,self.axes.transAxes))
+        self.axes.add_line(self.feature_line)
+    def update_lines(self,xl,xr,max_points):
+        (times,data) = self.windows.get(xl,xr,max_points)
+        for (i,line) in enumerate(self.lines):
+            line.set_data(times,data[:,i])
+        if self.features is not None:
+            (times,values) = self.features
+            i0 = max(np.searchsorted(times,xl,'right')-1,0)
+            i1 = min(np.searchsorted(times,xr,'right')+1,len(times))
+            self.feature_line.set_data(times[i0:i1],values[i0:i1])
+
 class Display(FigureCanvas):
     """
     :param src: The data-source to be displayed
@@ -25,8 +120,12 @@ class Display(FigureCanvas):
     :type model: :class:`annotation.Annotations`
     :param state: The application's input state to be manipulated
     :type state: :class:`inputstate.InputState`
+    :param pyramid: The level of detail summaries of the source if they have been built already
+    :type pyramid: :class:`lod.DecimationPyramid`
 
     Provides a visual representation of both a data-source and the annotations.
+    More sources can be added with :func:`add_track`; they are stacked in the same figure and share its
+    time axis, the annotations are drawn once across all of them, so a scroll or zoom is rendered in one pass.
 
     +---------------------+------------------------+-------------------------+
     |Signal               | Signature              | Description             |
@@ -35,48 +134,222 @@ class Display(FigureCanvas):
     |                     |:class:`float`          | is moved. Gives the x-  |
     |                     |                        | y-coordinate.           |
     +---------------------+------------------------+-------------------------+
+    |"zoom-request"       |:class:`float`,         | Called when the mouse   |
+    |                     |:class:`int`            | wheel is turned with    |
+    |                     |                        | Control held down. Gives|
+    |                     |                        | the time under the      |
+    |                     |                        | cursor and the steps,   |
+    |                     |                        | positive for zooming in.|
+    +---------------------+------------------------+-------------------------+
+
+    .. attribute:: cache_size
+
+       The number of fetched tiles of data that are kept (see :class:`lod.WindowCache`).
+
+    .. attribute:: read_ahead
+
+       The number of tiles that are fetched in advance in the direction of scrolling (see :func:`prefetch_job`).
+
+    .. attribute:: max_fps
+
+       The maximal number of redraws per second while an annotation is dragged or resized.
+
+    .. attribute:: use_blit
+
+       If set, the selection, the preview of a changed annotation and the cursor are drawn in an overlay.
+       The rest of the plot is rendered once and then restored from a cached background.
     """
     __metaclass__ = DisplayMeta
-    def __init__(self,src,model,state):
-        self.src = src
+    points_per_pixel = 2
+    cache_size = 16
+    read_ahead = 2
+    max_fps = 30
+    use_blit = True
+    def __init__(self,src,model,state,pyramid=None):
         self.model = model
         self.__state = state
-        state.connect('selection-changed',self.update_spanner)
-        state.connect('selection-removed',self.remove_spanner)
+        self.state_handlers = [state.connect('selection-changed',self.update_spanner),
+                               state.connect('selection-removed',self.remove_spanner),
+                               state.connect('preview-changed',self.update_preview),
+                               state.connect('preview-removed',self.remove_preview)]
         xb = src.get_time_bounds()
-        yb = src.get_data_bounds()
         figure = Figure(dpi=100)
-        self.plot = figure.add_subplot(111,xbound=xb,ybound=yb,autoscale_on=False)
-        self.plot.plot_date(src.get_time(True),src.get_data(True),'-')
-        if state.selection is None:
-            self.spanner = None
-        else:
+        pars = figure.subplotpars
+        self.plot = figure.add_axes((pars.left,pars.bottom,pars.right-pars.left,pars.top-pars.bottom),
+                                    xbound=xb,ybound=(0,1),autoscale_on=False,zorder=-1)
+        self.plot.get_xaxis().set_visible(False)
+        self.plot.get_yaxis().set_visible(False)
+        self.bounds = xb
+        self.tracks = []
+        self.track_count = 0
+        self.add_track(src,pyramid)
+        self.spanner = self.plot.axvspan(xb[0],xb[0],alpha=0.5,visible=False,animated=self.use_blit)
+        self.preview = self.plot.axvspan(xb[0],xb[0],alpha=0.3,visible=False,animated=self.use_blit)
+        self.cursor = self.plot.axvline(xb[0],color='k',linewidth=0.5,visible=False,animated=self.use_blit)
+        self.overlay = [self.spanner,self.preview,self.cursor]
+        self.background = None
+        if state.selection is not None:
             vall,valr = state.selection
-            self.spanner = self.plot.axvspan(vall,valr,alpha=0.5)
-        self.ctx_spanners = dict()
+            self._set_span(self.spanner,vall,valr)
+        self.spans = SpanLayer(self.plot,model)
+        self.last_draw = 0
+        self.draw_pending = False
         FigureCanvas.__init__(self,figure)
         self.mpl_connect('button_press_event',self.on_press)
         self.mpl_connect('button_release_event',self.on_release)
         self.mpl_connect('motion_notify_event',self.on_move)
-        model.connect('annotation-added',self.notice_annotation)
-        model.connect('annotation-removed',self.notice_annotation_removal)
-        model.connect('annotation-changed',self.notice_annotation_change)
-
-        for (id,color,boundl,boundr) in model.annotations():
-            self.notice_annotation(model,id,color,boundl,boundr)
+        self.mpl_connect('axes_leave_event',self.on_leave)
+        self.mpl_connect('scroll_event',self.on_scroll)
+        self.mpl_connect('resize_event',lambda ev: self.update_lines())
+        self.mpl_connect('draw_event',self.on_draw)
+        self.model_handlers = [model.connect('annotation-added',self.notice_annotation),
+                               model.connect('annotation-removed',self.notice_annotation_removal),
+                               model.connect('annotation-changed',self.notice_annotation_change),
+                               model.connect('annotations-bulk-changed',self.notice_bulk_change)]
+        self.connect('destroy',self.on_destroy)
+    def on_destroy(self,widget):
+        """
+        Disconnects from the model and the input state, so a removed display is neither redrawn nor kept alive by them."""
+        for handler in self.model_handlers:
+            self.model.disconnect(handler)
+        for handler in self.state_handlers:
+            self.__state.disconnect(handler)
+        self.model_handlers = []
+        self.state_handlers = []
+        self.background = None
+    def _set_span(self,span,vall,valr):
+        span.set_xy([(vall,0),(vall,1),(valr,1),(valr,0),(vall,0)])
+        span.set_visible(vall != valr)
     def update_spanner(self,state,vall,valr):
-        self.remove_spanner(state)
-        if vall != valr:
-            self.spanner = self.plot.axvspan(vall,valr,alpha=0.5)
-        self.draw_idle()
+        self._set_span(self.spanner,vall,valr)
+        self.update_overlay()
     def remove_spanner(self,state):
-        if self.spanner is not None:
-            self.spanner.remove()
-            self.spanner = None
+        self.spanner.set_visible(False)
+        self.update_overlay()
+    def update_preview(self,state,id,vall,valr):
+        if self.spans.hidden != id:
+            (ctx,col,boundl,boundr) = self.model.get_annotation(id)
+            self.spans.hide(id)
+            self.preview.set_facecolor(col)
+            self._set_span(self.preview,vall,valr)
+            self.draw_idle()
+        else:
+            self._set_span(self.preview,vall,valr)
+            self.update_overlay()
+    def remove_preview(self,state):
+        self.preview.set_visible(False)
+        self.spans.hide(None)
+        self.draw_idle()
+    def on_draw(self,event):
+        if self.use_blit:
+            self.background = self.copy_from_bbox(self.plot.bbox)
+            for artist in self.overlay:
+                if artist.get_visible():
+                    self.plot.draw_artist(artist)
+    def update_overlay(self):
+        """
+        Redraws the selection, the preview and the cursor.
+        In overlay mode they are blitted onto the cached background, otherwise the whole figure is redrawn."""
+        if self.window is None:
+            return
+        if not self.use_blit or self.background is None:
+            self.request_draw()
+            return
+        self.restore_region(self.background)
+        for artist in self.overlay:
+            if artist.get_visible():
+                self.plot.draw_artist(artist)
+        self.blit(self.plot.bbox)
+    def request_draw(self):
+        """
+        Like :func:`draw_idle`, but redraws at most :attr:`max_fps` times per second.
+        Requests that arrive in between are coalesced into one redraw."""
+        if self.draw_pending:
+            return
+        wait = self.last_draw + 1.0/self.max_fps - time.time()
+        if wait > 0:
+            self.draw_pending = True
+            gobject.timeout_add(int(wait*1000)+1,self._throttled_draw)
+        else:
+            self._throttled_draw()
+    def _throttled_draw(self):
+        self.draw_pending = False
+        self.last_draw = time.time()
+        self.draw_idle()
+        return False
+    def add_track(self,src,pyramid=None):
+        """
+        :param src: The data-source to be displayed
+        :type src: :class:`sources.Source`
+        :param pyramid: The level of detail summaries of the source if they have been built already
+        :type pyramid: :class:`lod.DecimationPyramid`
+        :rtype: :class:`Track`
+
+        Adds a source below the ones already shown."""
+        self.track_count += 1
+        axes = self.plot.figure.add_axes(self.plot.get_position(),sharex=self.plot,autoscale_on=False,
+                                         label='track%d' % self.track_count)
+        axes.patch.set_visible(False)
+        track = Track(self,axes,src,pyramid)
+        self.tracks.append(track)
+        self._layout()
+        return track
+    def remove_track(self,track):
+        """
+        :param track: The track to remove, not the last one
+        :type track: :class:`Track`"""
+        self.tracks.remove(track)
+        self.plot.figure.delaxes(track.axes)
+        self._layout()
+        self.draw_idle()
+    def _layout(self):
+        grid = GridSpec(len(self.tracks),1)
+        for (i,track) in enumerate(self.tracks):
+            track.axes.set_position(grid[i].get_position(self.plot.figure))
+            track.axes.tick_params(axis='x',labelbottom=(i == len(self.tracks)-1))
+    def track_at(self,event):
+        """
+        :param event: A mouse event
+        :type event: :class:`matplotlib.backend_bases.MouseEvent`
+        :returns: The track under the mouse or the nearest one if the mouse is between two tracks
+        :rtype: :class:`Track`"""
+        best = None
+        for track in self.tracks:
+            if track.axes is event.inaxes:
+                return track
+            (y0,y1) = track.axes.bbox.intervaly
+            dist = max(y0-event.y,event.y-y1)
+            if best is None or dist < best[0]:
+                best = (dist,track)
+        return best[1]
     def update_zoom(self,policy):
-        self.plot.set_xlim(*policy.get_bounds())
+        self.bounds = policy.get_bounds()
+        self.plot.set_xlim(*self.bounds)
         self.plot.get_xaxis().set_major_locator(policy.get_locator())
+        self.plot.get_xaxis().set_major_formatter(policy.get_formatter())
+        self.spans.refresh(self.bounds)
+        self.update_lines()
+    def update_lines(self):
+        """
+        Replaces the plotted data by the level of detail that fits the visible window and the width of the canvas."""
+        (width,height) = self.get_width_height()
+        for track in self.tracks:
+            track.update_lines(self.bounds[0],self.bounds[1],self.points_per_pixel*width)
         self.draw_idle()
+    def prefetch_job(self,direction):
+        """
+        :param direction: The predicted direction of scrolling, see :attr:`prefetch.Prefetcher.direction`
+        :type direction: :class:`int`
+        :returns: A job that fetches the data next to the visible window of every track, to be run by a :class:`prefetch.Prefetcher`
+        :rtype: :func:`callable`"""
+        (width,height) = self.get_width_height()
+        windows = [track.windows for track in self.tracks]
+        (xl,xr) = self.bounds
+        max_points = self.points_per_pixel*width
+        def job():
+            for w in windows:
+                w.warm(xl,xr,max_points,direction)
+        return job
     def _border_offset(self):
         (startx,starty) = self.figure.get_axes()[0].transData.inverted().transform_point((0,0))
         (endx,endy)     = self.figure.get_axes()[0].transData.inverted().transform_point((10,10))
@@ -88,29 +361,41 @@ class Display(FigureCanvas):
                 time = 0
             else:
                 time = event.guiEvent.get_time()
-            self.__state.button_down(self,event.button,event.xdata,self._border_offset(),time)
+            self.__state.button_down(self.track_at(event),event.button,event.xdata,self._border_offset(),time)
     def on_release(self,event):
         if event.xdata != None and event.ydata != None:
             if event.guiEvent is None:
                 time = 0
             else:
                 time = event.guiEvent.get_time()
-            self.__state.button_up(self,event.button,event.xdata,self._border_offset(),time)
+            self.__state.button_up(self.track_at(event),event.button,event.xdata,self._border_offset(),time)
     def on_move(self,event):
         if event.xdata != None and event.ydata != None:
             if event.guiEvent is None:
                 time = 0
             else:
                 time = event.guiEvent.get_time()
-            self.__state.move(self,event.xdata,time)
+            self.cursor.set_xdata([event.xdata,event.xdata])
+            self.cursor.set_visible(True)
+            self.emit('cursor-move',event.xdata,event.ydata)
+            self.__state.move(self.track_at(event),event.xdata,time)
+            self.update_overlay()
+    def on_scroll(self,event):
+        if event.xdata is not None and event.guiEvent is not None and event.guiEvent.state & gtk.gdk.CONTROL_MASK:
+            self.emit('zoom-request',event.xdata,event.step)
+    def on_leave(self,event):
+        self.cursor.set_visible(False)
+        self.update_overlay()
     def notice_annotation(self,model,id,col,start,end):
-        self.ctx_spanners[id] = self.plot.axvspan(start,end,alpha=0.3,facecolor=col)
-        self.draw_idle()
+        if self.spans.intersects(start,end):
+            self.spans.refresh()
+            self.draw_idle()
     def notice_annotation_removal(self,model,id):
-        self.ctx_spanners[id].remove()
-        del self.ctx_spanners[id]
+        self.spans.refresh()
         self.draw_idle()
     def notice_annotation_change(self,model,id,ctx,col,start,end):
-        self.ctx_spanners[id].remove()
-        self.ctx_spanners[id] = self.plot.axvspan(start,end,alpha=0.3,facecolor=col)
+        self.spans.refresh()
+        self.draw_idle()
+    def notice_bulk_change(self,model):
+        self.spans.refresh()
         self.draw_idle()
@@ -0,0 +1,160 @@
+"""
+Exporting
+=========
+
+The export writes one line per annotated sample: the layout of the movement logs the annotator reads
+(see :func:`encode_chunk`), followed by the name of the context.
+
+This is not the format of ``AnnPkg.export``, which the export used before. That format belongs to annpkg and
+is written in one pass over everything, so it can neither be split into chunks nor be encoded in parallel.
+Files of the new format can be read back like any movement log, and ``tools/extract.sh`` still splits them by context.
+"""
+import threading
+import collections
+import multiprocessing
+from cStringIO import StringIO
+import numpy as np
+from annotation import UNIX_EPOCH
+
+def encode_chunk(chunk):
+    """
+    :param chunk: The timestamps, the samples and the context of a chunk
+    :type chunk: (:class:`numpy.ndarray`, :class:`numpy.ndarray`, :class:`str`)
+    :returns: The lines of the chunk
+    :rtype: :class:`str`
+
+    Encodes every sample as one line of the movement log it was read from (seconds and microseconds since 1.1.1970
+    and the values of all channels, separated by tabs) followed by the name of the context.
+    The microseconds are rounded, a rounding up to a full second is carried into the seconds."""
+    (times,data,ctx) = chunk
+    secs = (np.asarray(times,dtype=np.float64)-UNIX_EPOCH)*86400.0
+    whole = np.floor(secs)
+    usecs = np.rint((secs-whole)*1e6)
+    carry = usecs >= 1000000
+    whole[carry] += 1
+    usecs[carry] -= 1000000
+    if data.ndim == 1:
+        data = data.reshape((-1,1))
+    value_fmt = "%d" if np.issubdtype(data.dtype,np.integer) else "%.10g"
+    rows = np.column_stack((whole,usecs,data))
+    fmt = "%d\t%06d\t"+"\t".join([value_fmt]*data.shape[1])+"\t"+ctx.replace("%","%%")
+    buf = StringIO()
+    np.savetxt(buf,rows,fmt=fmt)
+    return buf.getvalue()
+
+def split_chunks(times,names,starts,ends,max_rows):
+    """
+    :param times: The timestamps of a source
+    :type times: :class:`numpy.ndarray`
+    :param names: The contexts of the annotations
+    :type names: \[ :class:`str` \]
+    :param starts: The starts of the annotations
+    :type starts: :class:`numpy.ndarray`
+    :param ends: The ends of the annotations
+    :type ends: :class:`numpy.ndarray`
+    :param max_rows: The maximal number of samples in a chunk
+    :type max_rows: :class:`int`
+    :returns: The first and last sample index and the context of every chunk
+    :rtype: \[ (:class:`int`, :class:`int`, :class:`str`) \]
+
+    Splits a source into chunks that start and end at annotation boundaries.
+    Annotations with more than *max_rows* samples are split into several chunks."""
+    i0 = np.searchsorted(times,starts,'left')
+    i1 = np.searchsorted(times,ends,'right')
+    chunks = []
+    for k in np.argsort(starts,kind='mergesort'):
+        for lo in xrange(i0[k],i1[k],max_rows):
+            chunks.append((lo,min(lo+max_rows,i1[k]),names[k]))
+    return chunks
+
+class ExportWriter(threading.Thread):
+    """
+    :param fn: The name of the file to write
+    :type fn: :class:`str`
+    :param sources: The sources to export
+    :type sources: \[ :class:`sources.Source` \]
+    :param annotations: The contexts, starts and ends of the annotations as returned by :func:`annotation.Annotations.columns`
+    :type annotations: (\[ :class:`str` \], :class:`numpy.ndarray`, :class:`numpy.ndarray`)
+    :param cb: Called with the fraction of samples written so far
+    :type cb: :func:`callable`
+    :param end_cb: Called once the export is finished, whether it succeeded or not
+    :type end_cb: :func:`callable`
+    :param error_cb: Called with the exception if the export fails
+    :type error_cb: :func:`callable`
+    :param pool: The worker processes that encode the chunks, or :const:`None` to encode them in the export thread
+    :type pool: :class:`multiprocessing.pool.Pool`
+
+    Exports the annotated samples of all sources in a background thread, one line per annotated sample (see :func:`encode_chunk`).
+
+    The sources are split into chunks along the annotation boundaries (see :func:`split_chunks`),
+    which are encoded by a pool of worker processes and written to the file in order as soon as they are done.
+    Encoding is plain Python string formatting, so only processes run it in parallel. A program with a
+    user interface has to start the pool before it loads gtk, as a running user interface must not be forked.
+    At most :attr:`queue_factor` chunks per core are in flight, so memory use does not grow with the size of the export.
+
+    .. attribute:: max_rows
+
+       The maximal number of samples encoded in one chunk.
+
+    .. attribute:: queue_factor
+
+       The number of chunks per core that are queued at most.
+    """
+    max_rows = 65536
+    queue_factor = 2
+    def __init__(self,fn,sources,annotations,cb=None,end_cb=None,error_cb=None,pool=None):
+        threading.Thread.__init__(self,name="export thread")
+        self.daemon = True
+        self.fn = fn
+        self.sources = sources
+        (self.names,self.starts,self.ends) = annotations
+        self.cb = cb
+        self.end_cb = end_cb
+        self.error_cb = error_cb
+        self.pool = pool
+    def run(self):
+        try:
+            self.write()
+        except Exception as e:
+            if self.error_cb is not None:
+                self.error_cb(e)
+        finally:
+            if self.end_cb is not None:
+                self.end_cb()
+    def write(self):
+        """
+        Writes the export, see :class:`ExportWriter`. Called by the thread, but can be used without it as well."""
+        plan = []
+        total = 0
+        for src in self.sources:
+            times = src.get_time(True)
+            chunks = split_chunks(times,self.names,self.starts,self.ends,self.max_rows)
+            plan.append((src,times,chunks))
+            total += sum(i1-i0 for (i0,i1,ctx) in chunks)
+        max_pending = self.queue_factor*multiprocessing.cpu_count() if self.pool is not None else 0
+        with open(self.fn,'wb') as h:
+            done = 0
+            pending = collections.deque()
+            for (src,times,chunks) in plan:
+                data = src.get_data(True)
+                for (i0,i1,ctx) in chunks:
+                    chunk = (np.asarray(times[i0:i1]),np.asarray(data[i0:i1]),ctx)
+                    if self.pool is None:
+                        pending.append((i1-i0,encode_chunk(chunk)))
+                    else:
+                        pending.append((i1-i0,self.pool.apply_async(encode_chunk,(chunk,))))
+                    while len(pending) > max_pending:
+                        done += self.__write(h,pending.popleft())
+                        self.__progress(done,total)
+            while pending:
+                done += self.__write(h,pending.popleft())
+                self.__progress(done,total)
+    def __write(self,h,(rows,res)):
+        if isinstance(res,str):
+            h.write(res)
+        else:
+            h.write(res.get())
+        return rows
+    def __progress(self,done,total):
+        if self.cb is not None and total > 0:
+            self.cb(float(done)/total)
@@ -0,0 +1,178 @@
+"""
+Windowed features
+=================
+"""
+import os
+import tempfile
+import weakref
+import numpy as np
+from memmapsource import CACHE_DIR
+from blobcache import source_digest
+
+FEATURES = ('mean','var','energy','zcr')
+CHUNK_ROWS = 1024*1024
+
+_features = weakref.WeakKeyDictionary()
+
+def compute(times,data,window):
+    """
+    :param times: The timestamps of the samples
+    :type times: :class:`numpy.ndarray`
+    :param data: The samples, one row per timestamp and one column per channel
+    :type data: :class:`numpy.ndarray`
+    :param window: The length of a window in seconds
+    :type window: :class:`float`
+    :returns: The start of every window (``time``) and, for every name in :data:`FEATURES`, an array with one row per window and one column per channel
+    :rtype: :class:`dict`
+
+    Splits the samples into consecutive windows of equal length and computes the mean, the variance,
+    the energy (the mean square) and the zero-crossing rate (the fraction of samples whose sign differs from the previous one) of every window.
+    Windows without samples are :const:`nan`. Long sources are processed in chunks of about :data:`CHUNK_ROWS` samples."""
+    data = np.asanyarray(data)
+    if data.ndim == 1:
+        data = data.reshape((-1,1))
+    width = window/86400.0
+    starts = np.arange(times[0],times[-1]+width,width) if len(times) > 0 else np.empty(0)
+    idx = np.searchsorted(times,starts,'left')
+    bounds = np.append(idx,len(times))
+    counts = np.diff(bounds)
+    sums = np.zeros((len(starts),data.shape[1]))
+    squares = np.zeros((len(starts),data.shape[1]))
+    crossings = np.zeros((len(starts),data.shape[1]))
+    w0 = 0
+    while w0 < len(starts):
+        w1 = max(np.searchsorted(bounds,bounds[w0]+CHUNK_ROWS,'right')-1,w0+1)
+        filled = np.nonzero(counts[w0:w1])[0]+w0
+        if len(filled) > 0:
+            chunk = np.asarray(data[bounds[w0]:bounds[w1]],dtype=np.float64)
+            offsets = bounds[filled]-bounds[w0]
+            sums[filled] = np.add.reduceat(chunk,offsets,axis=0)
+            squares[filled] = np.add.reduceat(chunk*chunk,offsets,axis=0)
+            signs = np.signbit(chunk)
+            flips = np.zeros(chunk.shape,dtype=np.int64)
+            flips[1:] = signs[1:] != signs[:-1]
+            if bounds[w0] > 0:
+                flips[0] = np.signbit(np.asarray(data[bounds[w0]-1],dtype=np.float64)) != signs[0]
+            crossings[filled] = np.add.reduceat(flips,offsets,axis=0)
+        w0 = w1
+    with np.errstate(invalid='ignore',divide='ignore'):
+        n = counts.reshape((-1,1)).astype(np.float64)
+        n[n == 0] = np.nan
+        mean = sums/n
+        energy = squares/n
+        return {'time':starts,
+                'mean':mean,
+                'var':np.maximum(energy-mean*mean,0.0),
+                'energy':energy,
+                'zcr':crossings/n}
+
+def cache_dir(fn=None):
+    """
+    :param fn: The name of the annotation package the sources belong to, or :const:`None` if it hasn't been saved yet
+    :type fn: :class:`str`
+    :returns: The directory in which features are cached, next to the package if there is one
+    :rtype: :class:`str`"""
+    if fn is None:
+        return os.path.join(CACHE_DIR,'features')
+    return fn+'.features'
+
+def cache_file(directory,digest,window):
+    """
+    :returns: The name of the file holding the features of a source (identified by its digest, see :func:`blobcache.source_digest`) for a window length
+    :rtype: :class:`str`"""
+    return os.path.join(directory,"%s-%r.npz" % (digest,float(window)))
+
+def load(directory,digest,window):
+    """
+    :returns: The cached features or :const:`None` if they haven't been computed yet
+    :rtype: :class:`dict`"""
+    cfn = cache_file(directory,digest,window)
+    if not os.path.exists(cfn):
+        return None
+    with np.load(cfn) as h:
+        return dict((name,h[name]) for name in ('time',)+FEATURES)
+
+def store(directory,digest,window,feats):
+    """
+    Writes the features to the cache. Every writer uses its own temporary file, so threads that
+    computed the same features at the same time simply replace each other's result."""
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    cfn = cache_file(directory,digest,window)
+    (fd,tmp) = tempfile.mkstemp(suffix='.tmp',prefix=os.path.basename(cfn)+'.',dir=directory)
+    try:
+        with os.fdopen(fd,'wb') as h:
+            np.savez(h,**feats)
+        os.rename(tmp,cfn)
+    except:
+        os.remove(tmp)
+        raise
+
+def features(src,window,directory=None):
+    """
+    :param src: The source
+    :type src: :class:`sources.Source`
+    :param window: The length of a window in seconds
+    :type window: :class:`float`
+    :param directory: The cache directory, see :func:`cache_dir`
+    :type directory: :class:`str`
+    :returns: The features of the source, see :func:`compute`
+    :rtype: :class:`dict`
+
+    Looks the features up in memory, then on disk, and only computes (and stores) them if neither has them."""
+    if directory is None:
+        directory = cache_dir()
+    try:
+        known = _features[src]
+    except (KeyError,TypeError):
+        known = dict()
+    key = (directory,float(window))
+    if key in known:
+        return known[key]
+    digest = source_digest(src)
+    feats = load(directory,digest,window)
+    if feats is None:
+        feats = compute(src.get_time(True),src.get_data(True),window)
+        store(directory,digest,window,feats)
+    known[key] = feats
+    try:
+        _features[src] = known
+    except TypeError:
+        pass
+    return feats
+
+def suggest(feats,name='energy',threshold=2.0,min_windows=2):
+    """
+    :param feats: The features of a source, see :func:`features`
+    :type feats: :class:`dict`
+    :param name: The feature to look at, one of :data:`FEATURES`
+    :type name: :class:`str`
+    :param threshold: How many standard deviations above its median the feature has to be
+    :type threshold: :class:`float`
+    :param min_windows: The minimal number of consecutive windows of a suggestion
+    :type min_windows: :class:`int`
+    :returns: Start- and end-time of every suggested segment
+    :rtype: \[ (:class:`float`, :class:`float`) \]
+
+    Suggests the segments in which a feature (averaged over all channels) stands out, e.g. phases of activity."""
+    values = feats[name]
+    if values.ndim == 2:
+        with np.errstate(invalid='ignore'):
+            values = np.mean(values,axis=1)
+    starts = feats['time']
+    if len(values) < 2:
+        return []
+    valid = np.isfinite(values)
+    if not valid.any():
+        return []
+    level = np.median(values[valid])+threshold*np.std(values[valid])
+    active = np.zeros(len(values)+2,dtype=bool)
+    active[1:-1][valid] = values[valid] > level
+    changes = np.diff(active.astype(np.int8))
+    first = np.nonzero(changes == 1)[0]
+    last = np.nonzero(changes == -1)[0]
+    width = starts[1]-starts[0]
+    return [(float(starts[a]),float(starts[b-1]+width)) for (a,b) in zip(first,last) if b-a >= min_windows]
@@ -0,0 +1,66 @@
+"""
+The GObject data model
+======================
+"""
+import gobject
+from annotation import Annotations,SIGNALS
+
+class AnnotationsMeta(gobject.GObjectMeta):
+    def __init__(cls,*kwds):
+        gobject.GObjectMeta.__init__(cls,*kwds)
+        cls.__gtype_name__ = cls.__name__
+        gobject.signal_new('annotation-added', cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_INT,gobject.TYPE_STRING,gobject.TYPE_DOUBLE,gobject.TYPE_DOUBLE))
+        gobject.signal_new('annotation-removed',cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_INT,))
+        gobject.signal_new('context-added',cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_STRING,gobject.TYPE_STRING))
+        gobject.signal_new('context-removed',cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_STRING,))
+        gobject.signal_new('annotation-changed',cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_INT,gobject.TYPE_STRING,gobject.TYPE_STRING,gobject.TYPE_DOUBLE,gobject.TYPE_DOUBLE))
+        gobject.signal_new('annotations-bulk-changed',cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           ())
+        gobject.type_register(cls)
+
+class GAnnotations(gobject.GObject):
+    """
+    :param model: The model to wrap, a new one is created if :const:`None`
+    :type model: :class:`annotation.Annotations`
+
+    Makes a :class:`annotation.Annotations` model available to the user interface.
+    The signals of the model are emitted as GObject signals with the same names and arguments,
+    all other attributes are looked up in the model.
+
+    .. attribute:: model
+
+       The wrapped model.
+    """
+    __metaclass__ = AnnotationsMeta
+    def __init__(self,model=None):
+        gobject.GObject.__init__(self)
+        if model is None:
+            model = Annotations()
+        self.model = model
+        for signal in SIGNALS:
+            model.connect(signal,self.__forward,signal)
+    def __forward(self,model,*args):
+        self.emit(args[-1],*args[:-1])
+    def __getattr__(self,name):
+        return getattr(self.model,name)
+    def __iter__(self):
+        return iter(self.model)
+    def __len__(self):
+        return len(self.model)
@@ -110,7 +110,8 @@ class Dragging(Limited):
     :param limitr: The right-side limit of the dragging operation, or :const:`None` if there's none
     :type limitr: :class:`float`
     
-    The user begun to drag an annotation around. We're waiting for him/her to release the mouse. """
+    The user begun to drag an annotation around. We're waiting for him/her to release the mouse.
+    Until then only the preview is moved, the model is updated once the mouse is released. """
     def __init__(self,par,id,width,drag_offset,limitl,limitr):
         self.parent = par
         self.id = id
@@ -130,11 +131,14 @@ class Dragging(Limited):
         boundl = x-self.offset
         boundr = x-self.offset+self.width
         self.parent.set_message(num2date(boundl).strftime("%c, %fus")+" - "+num2date(boundr).strftime("%c, %fus"))
-        self.parent.model.update_annotation(self.id,boundl,boundr)
+        self.parent.set_preview((self.id,boundl,boundr))
+        return (boundl,boundr)
     def button_down(self,display,but,x,border_offset,time):
         return self
     def button_up(self,display,but,x,border_offset,time):
-        self._update(x)
+        (boundl,boundr) = self._update(x)
+        self.parent.model.update_annotation(self.id,boundl,boundr)
+        self.parent.set_preview(None)
         return Viewing(self.parent)
     def move(self,display,x,time):
         self._update(x)
@@ -156,6 +160,7 @@ class Resizing(Limited):
     :type limit: :class:`float`
 
     The user has clicked on the border of an annotation and thus is resizing the annotation.
+    Until the mouse is released only the preview is resized.
     """
     def __init__(self,par,id,which,drag_offset,other,limit):
         self.parent = par
@@ -185,12 +190,15 @@ class Resizing(Limited):
             boundl = x-self.offset
             boundr = self.other
         self.parent.set_message(num2date(boundl).strftime("%c, %fus")+" - "+num2date(boundr).strftime("%c, %fus"))
-        self.parent.model.update_annotation(self.id,boundl,boundr)
+        self.parent.set_preview((self.id,boundl,boundr))
+        return (boundl,boundr)
     def move(self,display,x,time):
         self._update(x)
         return self
     def button_up(self,display,but,x,border_offset,time):
-        self._update(x)
+        (boundl,boundr) = self._update(x)
+        self.parent.model.update_annotation(self.id,boundl,boundr)
+        self.parent.set_preview(None)
         return Viewing(self.parent)
     def button_down(self,display,but,x,border_offset,time):
         return self
@@ -219,6 +227,14 @@ class InputStateMeta(gobject.GObjectMeta):
                            gobject.SIGNAL_RUN_FIRST,
                            gobject.TYPE_NONE,
                            (gobject.TYPE_PYOBJECT,gobject.TYPE_INT,gobject.TYPE_INT))
+        gobject.signal_new('preview-changed',cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_INT,gobject.TYPE_DOUBLE,gobject.TYPE_DOUBLE))
+        gobject.signal_new('preview-removed',cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           ())
         gobject.type_register(cls)
 
 class InputState(gobject.GObject):
@@ -243,17 +259,25 @@ class InputState(gobject.GObject):
     |                     |                        | new information for the |
     |                     |                        | user (e.g. statusbar).  |
     +---------------------+------------------------+-------------------------+
-    |"select-selection"   |:class:`display.Display`| Called when the user    |
+    |"select-selection"   |:class:`display.Track`  | Called when the user    |
     |                     |, :class:`float`,       | right-clicks the        |
     |                     |:class:`float`,         | selected area in a      |
-    |                     |:class:`int`            | certain display.        |
+    |                     |:class:`int`            | certain track.          |
     +---------------------+------------------------+-------------------------+
-    |"select-annotation"  |:class:`display.Display`| Called when the user    |
+    |"select-annotation"  |:class:`display.Track`  | Called when the user    |
     |                     |, :class:`int`,         | right-clicks an         |
     |                     |:class:`int`            | annotation in a certain |
-    |                     |                        | display.                |
+    |                     |                        | track.                  |
     +---------------------+------------------------+-------------------------+
-    
+    |"preview-changed"    |:class:`int`,           | Called while an         |
+    |                     |:class:`float`,         | annotation is dragged or|
+    |                     |:class:`float`          | resized. Gives the id   |
+    |                     |                        | and the new time bounds.|
+    +---------------------+------------------------+-------------------------+
+    |"preview-removed"    |                        | Called when the drag or |
+    |                     |                        | resize operation ends.  |
+    +---------------------+------------------------+-------------------------+
+
     .. attribute:: state
     
        Contains the current state of the input processing.
@@ -265,6 +289,7 @@ class InputState(gobject.GObject):
         self.state = Viewing(self)
         self.model = model
         self.selection = None
+        self.preview = None
     def set_selection(self,new):
         """
         :param new: The new selection as two time-bounds or :const:`None`
@@ -277,6 +302,18 @@ class InputState(gobject.GObject):
             self.emit('selection-removed')
         else:
             self.emit('selection-changed',new[0],new[1])
+    def set_preview(self,new):
+        """
+        :param new: The id and time-bounds of the annotation being changed or :const:`None`
+        :type new: :class:`None` or (:class:`int`, :class:`float`, :class:`float`)
+
+        Sets the preview of an annotation that is being dragged or resized. Informs listeners about this.
+        """
+        self.preview = new
+        if new is None:
+            self.emit('preview-removed')
+        else:
+            self.emit('preview-changed',new[0],new[1],new[2])
     def set_message(self,str):
         self.emit('message-changed',str)
     def button_down(self,display,but,x,border_offset,time):
@@ -0,0 +1,274 @@
+"""
+The annotation journal
+======================
+"""
+import os
+import gobject
+
+MAGIC = 'CTXJOURNAL'
+VERSION = 1
+
+def journal_file(fn):
+    """
+    :param fn: The name of the annotation package
+    :type fn: :class:`str`
+    :returns: The name of the journal of the package
+    :rtype: :class:`str`"""
+    return fn+'.journal'
+
+def _header(fn):
+    st = os.stat(fn)
+    return "%s\t%d\t%d\t%r\n" % (MAGIC,VERSION,st.st_size,st.st_mtime)
+
+def _escape(name):
+    return name.encode('string_escape')
+
+def _unescape(name):
+    return name.decode('string_escape')
+
+class Journal:
+    """
+    :param model: The annotations to be journaled
+    :type model: :class:`annotation.Annotations`
+    :param fn: The name of the annotation package
+    :type fn: :class:`str`
+    :param checkpoint: Writes the annotations of the model to the package and returns whether it could
+    :type checkpoint: :func:`callable`
+
+    Records every change of the model in an append-only log next to the annotation package,
+    so a crash loses at most :attr:`interval` milliseconds of work since the package was last written.
+    The package together with its journal always describes the current state.
+
+    Every line of the journal is one record; all fields are separated by tabs:
+
+    +---------------------------+--------------------------------------------+
+    | Record                    | Meaning                                    |
+    +===========================+============================================+
+    | ``C`` name                | The context was added                      |
+    +---------------------------+--------------------------------------------+
+    | ``D`` name                | The context was removed                    |
+    +---------------------------+--------------------------------------------+
+    | ``A`` ctx start end       | The annotation was added                   |
+    +---------------------------+--------------------------------------------+
+    | ``R`` ctx start end       | The annotation was removed                 |
+    +---------------------------+--------------------------------------------+
+    | ``M`` ctx start end       | The annotation was moved to the new bounds |
+    | new_start new_end         |                                            |
+    +---------------------------+--------------------------------------------+
+    | ``Z``                     | All annotations and contexts were removed  |
+    +---------------------------+--------------------------------------------+
+
+    Annotations are identified by their content, as ids are not stable across sessions.
+    Bulk changes are compared with the annotations known to the journal and only the annotations that were
+    added or removed are recorded (see :func:`notice_bulk_change`).
+    The first line holds size and modification time of the package the journal belongs to,
+    a journal that does not match its package is discarded.
+
+    A journal that has grown by :attr:`max_records` records is folded into the package by *checkpoint* and emptied.
+    Without a *checkpoint*, or if it fails, the journal is compacted instead (see :func:`compact`).
+
+    .. attribute:: interval
+
+       The time in milliseconds after which appended records are synced to disk.
+
+    .. attribute:: max_records
+
+       The number of records after which the journal is folded into the package or compacted when it is synced next (see :func:`needs_compaction`).
+    """
+    interval = 2000
+    max_records = 10000
+    def __init__(self,model,fn,checkpoint=None):
+        self.model = model
+        self.fn = fn
+        self.checkpoint = checkpoint
+        self.handle = None
+        self.handlers = []
+        self.mirror = dict()
+        self.records = 0
+        self.base = 0
+        self.sync_id = None
+    def replay(self):
+        """
+        :returns: The number of records that have been replayed
+        :rtype: :class:`int`
+
+        Applies the records of the journal to the model, e.g. to recover the changes since the package was last written.
+        A truncated record at the end, left by a crash, is ignored."""
+        jfn = journal_file(self.fn)
+        if not os.path.exists(jfn):
+            return 0
+        with open(jfn,'rb') as h:
+            lines = h.read().split('\n')
+        if lines[0]+'\n' != _header(self.fn):
+            return 0
+        count = 0
+        with self.model.batch():
+            for ln in lines[1:-1]:
+                self.__apply(ln.split('\t'))
+                count += 1
+        self.records = count
+        return count
+    def __find(self,ctx,boundl,boundr):
+        for id in self.model.find_range(boundl,boundr):
+            (c,color,l,r) = self.model.get_annotation(id)
+            if c == ctx and l == boundl and r == boundr:
+                return id
+        return None
+    def __apply(self,rec):
+        kind = rec[0]
+        if kind == 'C':
+            self.model.add_context(_unescape(rec[1]))
+        elif kind == 'D':
+            self.model.remove_context(_unescape(rec[1]))
+        elif kind == 'A':
+            self.model.add_annotation(_unescape(rec[1]),float(rec[2]),float(rec[3]))
+        elif kind == 'R':
+            id = self.__find(_unescape(rec[1]),float(rec[2]),float(rec[3]))
+            if id is not None:
+                self.model.remove_annotation(id)
+        elif kind == 'M':
+            id = self.__find(_unescape(rec[1]),float(rec[2]),float(rec[3]))
+            if id is not None:
+                self.model.update_annotation(id,float(rec[4]),float(rec[5]))
+        elif kind == 'Z':
+            self.model.clear()
+        else:
+            raise IOError(journal_file(self.fn)+" contains an unknown record "+kind)
+    def start(self):
+        """
+        Starts recording the changes of the model. A journal that does not belong to the package is replaced."""
+        jfn = journal_file(self.fn)
+        header = _header(self.fn)
+        valid = False
+        if os.path.exists(jfn):
+            with open(jfn,'rb') as h:
+                valid = h.readline() == header
+        if valid:
+            self.handle = open(jfn,'ab')
+        else:
+            self.handle = open(jfn,'wb')
+            self.handle.write(header)
+            self.records = 0
+        self.__snapshot(False)
+        self.handlers = [self.model.connect('annotation-added',self.notice_annotation),
+                         self.model.connect('annotation-removed',self.notice_annotation_removal),
+                         self.model.connect('annotation-changed',self.notice_annotation_change),
+                         self.model.connect('annotations-bulk-changed',self.notice_bulk_change),
+                         self.model.connect('context-added',self.notice_context),
+                         self.model.connect('context-removed',self.notice_context_removal)]
+        self.sync()
+    def reset(self):
+        """
+        Empties the journal after the package has been written."""
+        self.handle.close()
+        self.handle = open(journal_file(self.fn),'wb')
+        self.handle.write(_header(self.fn))
+        self.records = 0
+        self.base = 0
+        self.sync()
+    def close(self):
+        """
+        Syncs the journal and stops recording."""
+        if self.handle is None:
+            return
+        for hid in self.handlers:
+            self.model.disconnect(hid)
+        self.handlers = []
+        self.sync()
+        self.handle.close()
+        self.handle = None
+    def sync(self):
+        """
+        Writes all records to disk."""
+        if self.sync_id is not None:
+            gobject.source_remove(self.sync_id)
+            self.sync_id = None
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+    def __timed_sync(self):
+        self.sync_id = None
+        if self.needs_compaction():
+            if not self.__checkpoint():
+                self.compact()
+        else:
+            self.sync()
+        return False
+    def __checkpoint(self):
+        if self.checkpoint is None:
+            return False
+        try:
+            if not self.checkpoint():
+                return False
+        except (IOError,OSError):
+            return False
+        self.reset()
+        return True
+    def compact(self):
+        """
+        Replaces the journal by a snapshot of the model, which is shorter than a long history of changes."""
+        jfn = journal_file(self.fn)
+        self.handle.close()
+        self.handle = open(jfn+'.tmp','wb')
+        self.handle.write(_header(self.fn))
+        self.records = 0
+        self.__snapshot(True)
+        self.sync()
+        self.handle.close()
+        os.rename(jfn+'.tmp',jfn)
+        self.handle = open(jfn,'ab')
+        self.base = self.records
+    def needs_compaction(self):
+        """
+        :rtype: :class:`bool`
+
+        Checks whether :attr:`max_records` records have been added since the package was written or the journal was compacted."""
+        return self.records >= self.base+self.max_records
+    def __append(self,*fields):
+        self.handle.write("\t".join(fields)+"\n")
+        self.records += 1
+        if self.sync_id is None:
+            self.sync_id = gobject.timeout_add(self.interval,self.__timed_sync)
+    def __record(self,kind,ctx,boundl,boundr):
+        self.__append(kind,_escape(ctx),repr(boundl),repr(boundr))
+    def __snapshot(self,record):
+        self.mirror = dict()
+        if record:
+            self.__append('Z')
+            for (name,color) in self.model.contexts():
+                self.__append('C',_escape(name))
+        for (id,color,boundl,boundr) in self.model.annotations():
+            ctx = self.model.get_annotation(id)[0]
+            self.mirror[id] = (ctx,boundl,boundr)
+            if record:
+                self.__record('A',ctx,boundl,boundr)
+    def notice_annotation(self,model,id,color,boundl,boundr):
+        ctx = model.get_annotation(id)[0]
+        self.mirror[id] = (ctx,boundl,boundr)
+        self.__record('A',ctx,boundl,boundr)
+    def notice_annotation_removal(self,model,id):
+        (ctx,boundl,boundr) = self.mirror.pop(id)
+        self.__record('R',ctx,boundl,boundr)
+    def notice_annotation_change(self,model,id,ctx,color,boundl,boundr):
+        (ctx,oldl,oldr) = self.mirror[id]
+        self.mirror[id] = (ctx,boundl,boundr)
+        self.__append('M',_escape(ctx),repr(oldl),repr(oldr),repr(boundl),repr(boundr))
+    def notice_bulk_change(self,model):
+        """
+        Records the annotations that were added, removed or moved by a batch of changes as ``A`` and ``R`` records,
+        found by comparing the model with the annotations recorded so far."""
+        names = dict((color,name) for (name,color) in model.contexts())
+        current = dict()
+        for (id,color,boundl,boundr) in model.annotations():
+            current[id] = (names[color],boundl,boundr)
+        for (id,entry) in self.mirror.items():
+            if current.get(id) != entry:
+                del self.mirror[id]
+                self.__record('R',*entry)
+        for (id,entry) in current.iteritems():
+            if id not in self.mirror:
+                self.mirror[id] = entry
+                self.__record('A',*entry)
+    def notice_context(self,model,name,color):
+        self.__append('C',_escape(name))
+    def notice_context_removal(self,model,name):
+        self.__append('D',_escape(name))
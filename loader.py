@@ -0,0 +1,143 @@
+"""
+Background loading
+==================
+"""
+import threading
+import time
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import gobject
+from lod import DecimationPyramid
+
+class LoadCancelled(Exception):
+    """
+    Raised in the loading thread once the user has cancelled loading."""
+    pass
+
+class SourceLoader(threading.Thread):
+    """
+    :param src: The source type to load
+    :type src: :class:`sources.Source`
+    :param fn: The name of the file to load
+    :type fn: :class:`str`
+    :param name: The name of the new sources
+    :type name: :class:`str`
+    :param args: The additional arguments of :func:`from_file`
+    :type args: :class:`dict`
+    :param cb: Called with the fraction loaded so far and the partially loaded sources or :const:`None`
+    :type cb: :func:`callable`
+    :param end_cb: Called with the loaded sources and their level of detail summaries (see :func:`prepare_sources`)
+    :type end_cb: :func:`callable`
+    :param error_cb: Called with the exception if loading fails
+    :type error_cb: :func:`callable`
+
+    Loads sources in a worker thread and prepares them for display there, so the user interface stays responsive.
+    All callbacks are run in the main loop. After :func:`cancel` has been called none of them are run anymore.
+
+    Source types that have the attribute ``progressive`` get the loader as ``progress`` argument of :func:`from_file`
+    and report their progress with :func:`update`. For all other types only the end of loading is reported.
+
+    .. attribute:: interval
+
+       The minimal time in seconds between two partial results.
+    """
+    interval = 0.5
+    def __init__(self,src,fn,name,args,cb=None,end_cb=None,error_cb=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.src = src
+        self.fn = fn
+        self.name = name
+        self.args = args
+        self.cb = cb
+        self.end_cb = end_cb
+        self.error_cb = error_cb
+        self.cancel_event = threading.Event()
+        self.partial_pending = False
+        self.last_partial = 0
+    def cancel(self):
+        """
+        Stops loading. Must be called from the main loop."""
+        self.cancel_event.set()
+    def cancelled(self):
+        """
+        :rtype: :class:`bool`"""
+        return self.cancel_event.is_set()
+    def update(self,fraction,partial=None):
+        """
+        :param fraction: The fraction loaded so far
+        :type fraction: :class:`float`
+        :param partial: Creates the sources loaded so far
+        :type partial: :func:`callable`
+
+        Reports the progress from the loading thread. Partial results are only created if the
+        last one has already been shown and at most every :attr:`interval` seconds.
+        Raises :class:`LoadCancelled` if loading was cancelled."""
+        if self.cancelled():
+            raise LoadCancelled()
+        sources = None
+        if partial is not None and not self.partial_pending and time.time() >= self.last_partial+self.interval:
+            sources = partial()
+            self.partial_pending = True
+        gobject.idle_add(self.__progress,fraction,sources)
+    def __progress(self,fraction,sources):
+        if sources is not None:
+            self.partial_pending = False
+            self.last_partial = time.time()
+        if not self.cancelled() and self.cb is not None:
+            self.cb(fraction,sources)
+        return False
+    def __finish(self,cb,*args):
+        if not self.cancelled() and cb is not None:
+            cb(*args)
+        return False
+    def run(self):
+        try:
+            if getattr(self.src,'progressive',False):
+                sources = self.src.from_file(self.fn,self.name,progress=self,**self.args)
+            else:
+                sources = self.src.from_file(self.fn,self.name,**self.args)
+            if self.cancelled():
+                return
+            pyramids = prepare_sources(sources)
+        except LoadCancelled:
+            return
+        except Exception as e:
+            gobject.idle_add(self.__finish,self.error_cb,e)
+            return
+        gobject.idle_add(self.__finish,self.end_cb,sources,pyramids)
+
+def prepare_source(src):
+    """
+    :param src: The source to prepare
+    :type src: :class:`sources.Source`
+    :returns: The level of detail summaries of the source, :const:`None` for sources that fetch windows themselves
+    :rtype: :class:`lod.DecimationPyramid`
+
+    Decodes the data of a source and builds everything its display needs."""
+    src.get_time_bounds()
+    src.get_data_bounds()
+    if hasattr(src,'get_range'):
+        return None
+    return DecimationPyramid(src.get_time(True),src.get_data(True))
+
+def prepare_sources(sources,processes=None):
+    """
+    :param sources: The sources to prepare
+    :type sources: \[ :class:`sources.Source` \]
+    :param processes: The number of worker threads, one per core if :const:`None`
+    :type processes: :class:`int`
+    :returns: The level of detail summaries of every source
+    :rtype: \[ :class:`lod.DecimationPyramid` \]
+
+    Runs :func:`prepare_source` for many sources at once."""
+    if len(sources) < 2:
+        return [prepare_source(src) for src in sources]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = ThreadPool(min(processes,len(sources)))
+    try:
+        return pool.map(prepare_source,sources,chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,212 @@
+"""
+Level of detail
+===============
+"""
+import math
+import threading
+import numpy as np
+from collections import OrderedDict
+
+class DecimationPyramid:
+    """
+    :param times: The timestamps of the samples
+    :type times: :class:`numpy.ndarray`
+    :param data: The samples, one row per timestamp and one column per channel
+    :type data: :class:`numpy.ndarray`
+    :param factor: The number of blocks of a level that are combined into one block of the next level
+    :type factor: :class:`int`
+    :param min_blocks: No further levels are built once a level has fewer blocks than this
+    :type min_blocks: :class:`int`
+
+    Keeps ever coarser min/max-summaries of a data series. Every block of a level
+    stores the first and last timestamp it covers and the minimum and maximum of
+    each channel, so peaks stay visible at every level.
+    The pyramid is built once; afterwards :func:`window` only slices.
+    """
+    def __init__(self,times,data,factor=4,min_blocks=512):
+        self.times = np.asarray(times)
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape((-1,1))
+        self.data = data
+        self.levels = []
+        t_lo = self.times
+        t_hi = self.times
+        lo = data
+        hi = data
+        while len(t_lo) > min_blocks:
+            idx = np.arange(0,len(t_lo),factor)
+            t_hi = t_hi[np.append(idx[1:]-1,len(t_hi)-1)]
+            t_lo = t_lo[idx]
+            lo = np.minimum.reduceat(lo,idx,axis=0)
+            hi = np.maximum.reduceat(hi,idx,axis=0)
+            self.levels.append((t_lo,t_hi,lo,hi))
+    def window(self,xl,xr,max_points):
+        """
+        :param xl: The start of the visible window
+        :type xl: :class:`float`
+        :param xr: The end of the visible window
+        :type xr: :class:`float`
+        :param max_points: The maximal number of points that should be returned
+        :type max_points: :class:`int`
+        :returns: Timestamps and samples to be plotted
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+
+        Selects the finest level that shows the window with at most *max_points* points and returns the matching slice of it.
+        One point beyond each side of the window is included, so lines leave the plot at the right angle."""
+        i0 = np.searchsorted(self.times,xl,'left')
+        i1 = np.searchsorted(self.times,xr,'right')
+        if i1-i0 <= max_points or len(self.levels) == 0:
+            i0 = max(i0-1,0)
+            i1 = min(i1+1,len(self.times))
+            return (self.times[i0:i1],self.data[i0:i1])
+        for (t_lo,t_hi,lo,hi) in self.levels:
+            j0 = np.searchsorted(t_hi,xl,'left')
+            j1 = np.searchsorted(t_lo,xr,'right')
+            if 2*(j1-j0) <= max_points:
+                break
+        j0 = max(j0-1,0)
+        j1 = min(j1+1,len(t_lo))
+        return interleave(t_lo[j0:j1],t_hi[j0:j1],lo[j0:j1],hi[j0:j1])
+
+def interleave(t_lo,t_hi,lo,hi):
+    """
+    Turns min/max-blocks into a line that runs from the minimum at the start of each block to the maximum at its end."""
+    times = np.empty(2*len(t_lo),dtype=t_lo.dtype)
+    times[0::2] = t_lo
+    times[1::2] = t_hi
+    data = np.empty((2*len(lo),lo.shape[1]),dtype=lo.dtype)
+    data[0::2] = lo
+    data[1::2] = hi
+    return (times,data)
+
+def decimate(times,data,max_points):
+    """
+    :param times: The timestamps of the samples
+    :type times: :class:`numpy.ndarray`
+    :param data: The samples, one row per timestamp
+    :type data: :class:`numpy.ndarray`
+    :param max_points: The maximal number of points that should be returned
+    :type max_points: :class:`int`
+    :returns: Timestamps and samples to be plotted, with one column per channel
+    :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+
+    Summarizes a slice of samples on the fly: if it has more than *max_points* samples,
+    it is split into equal blocks that are reduced to their minimum and maximum like a level of :class:`DecimationPyramid`."""
+    if data.ndim == 1:
+        data = data.reshape((-1,1))
+    n = len(times)
+    if n <= max_points:
+        return (times,data)
+    step = int(math.ceil(n/float(max(max_points//2,1))))
+    idx = np.arange(0,n,step)
+    return interleave(times[idx],times[np.append(idx[1:]-1,n-1)],
+                      np.minimum.reduceat(data,idx,axis=0),np.maximum.reduceat(data,idx,axis=0))
+
+class WindowCache:
+    """
+    :param fetch: Returns timestamps and samples of a window, called with start, end and the maximal number of points
+    :type fetch: :func:`callable`
+    :param size: The number of tiles that are kept
+    :type size: :class:`int`
+    :param prefetch: The number of tiles that are fetched in advance in the direction of scrolling
+    :type prefetch: :class:`int`
+
+    Fetches the data of a visible window in tiles at least as wide as the window and keeps the
+    most recently used tiles, so scrolling back and forth only fetches the tiles that
+    newly come into view. Tile widths are rounded up to powers of two, so zooming
+    reuses the tiles fetched for similar widths. :func:`warm` fetches the tiles next to the window in advance;
+    it may be called from another thread than :func:`get`, a tile that is being fetched
+    by one thread is waited for by the other instead of being fetched twice.
+    """
+    def __init__(self,fetch,size=16,prefetch=1):
+        self.fetch = fetch
+        self.size = size
+        self.prefetch = prefetch
+        self.tiles = OrderedDict()
+        self.pending = dict()
+        self.lock = threading.Lock()
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+    def tile(self,width,k,max_points):
+        """
+        :returns: The timestamps and samples of tile *k* of the given width
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)"""
+        key = (width,k,max_points)
+        while True:
+            with self.lock:
+                if key in self.tiles:
+                    res = self.tiles.pop(key)
+                    self.tiles[key] = res
+                    return res
+                ev = self.pending.get(key)
+                if ev is None:
+                    ev = self.pending[key] = threading.Event()
+                    break
+            ev.wait()
+        try:
+            (times,data) = self.fetch(k*width,(k+1)*width,max_points)
+            if data.ndim == 1:
+                data = data.reshape((-1,1))
+            res = (times,data)
+            with self.lock:
+                while len(self.tiles) >= self.size:
+                    self.tiles.popitem(last=False)
+                self.tiles[key] = res
+        finally:
+            with self.lock:
+                del self.pending[key]
+            ev.set()
+        return res
+    def _tiles(self,xl,xr,max_points):
+        width = 2.0**math.ceil(math.log(xr-xl,2))
+        return (width,int(math.floor(xl/width)),int(math.floor(xr/width)),2*max_points)
+    def get(self,xl,xr,max_points):
+        """
+        :param xl: The start of the visible window
+        :type xl: :class:`float`
+        :param xr: The end of the visible window
+        :type xr: :class:`float`
+        :param max_points: The maximal number of points in the window
+        :type max_points: :class:`int`
+        :returns: Timestamps and samples to be plotted
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)"""
+        max_points = int(max_points)
+        if xr <= xl:
+            return self.fetch(xl,xr,max_points)
+        (width,k0,k1,max_points) = self._tiles(xl,xr,max_points)
+        times = []
+        data = []
+        for k in range(k0,k1+1):
+            (t,d) = self.tile(width,k,max_points)
+            if k == k0:
+                lo = max(np.searchsorted(t,xl,'left')-1,0)
+            else:
+                lo = np.searchsorted(t,k*width,'left')
+            if k == k1:
+                hi = min(np.searchsorted(t,xr,'right')+1,len(t))
+            else:
+                hi = np.searchsorted(t,(k+1)*width,'left')
+            times.append(t[lo:hi])
+            data.append(d[lo:hi])
+        return (np.concatenate(times),np.concatenate(data))
+    def warm(self,xl,xr,max_points,direction=0):
+        """
+        :param direction: Positive if the window moves forward, negative if it moves backward, 0 if unknown
+        :type direction: :class:`int`
+
+        Fetches :attr:`prefetch` tiles ahead of the window in the given direction, or one tile on each side if the direction is unknown.
+        The arguments are the same as those of :func:`get`."""
+        max_points = int(max_points)
+        if xr <= xl:
+            return
+        (width,k0,k1,max_points) = self._tiles(xl,xr,max_points)
+        if direction > 0:
+            ks = range(k1+1,k1+1+self.prefetch)
+        elif direction < 0:
+            ks = range(k0-1,k0-1-self.prefetch,-1)
+        else:
+            ks = [k1+1,k0-1]
+        for k in ks:
+            self.tile(width,k,max_points)
@@ -6,40 +6,120 @@ Main Application
 ================
 """
 
-import numpy as np
+import sys
+import time
+
+class StartupProfile:
+    """
+    :param enabled: Whether the times should be collected
+    :type enabled: :class:`bool`
+
+    Collects the times of the phases of the startup and prints them to stderr.
+    Enabled by running main.py with ``--profile-startup``.
+    """
+    def __init__(self,enabled):
+        self.enabled = enabled
+        self.start = time.time()
+        self.marks = []
+    def mark(self,name):
+        if self.enabled:
+            self.marks.append((name,time.time()))
+    def report(self):
+        if not self.enabled:
+            return False
+        last = self.start
+        for (name,t) in self.marks:
+            sys.stderr.write("%-24s %8.1f ms %8.1f ms\n" % (name,(t-last)*1000,(t-self.start)*1000))
+            last = t
+        return False
+
+startup = StartupProfile('--profile-startup' in sys.argv)
+
+if __name__=="__main__":
+    import multiprocessing
+    # the processes that encode exports (see exporter.ExportWriter) are forked before gtk is loaded,
+    # the running user interface must not be forked
+    encoders = multiprocessing.Pool()
+    startup.mark("encoder processes")
+else:
+    encoders = None
+
 #import matplotlib.pyplot as plt
 import gtk
 import gobject
 import datetime
-import time
-import calendar
 import threading
-from matplotlib.dates import date2num,num2date,MinuteLocator,SecondLocator,seconds,minutes,hours,weeks
+startup.mark("gtk")
+from matplotlib.dates import date2num,num2date,seconds,minutes,hours,weeks
 import gettext
-import pytz
+startup.mark("matplotlib.dates")
 
 gettext.install('context-annotator','po')
 gobject.threads_init()
 
 from dateentry import DateEdit
 from timezone import UTC
-from annotation import Annotations
-from display import Display
+from gannotation import GAnnotations
 from inputstate import InputState
-from annpkg.model import *
-from annpkg.sources import all_sources
-from annpkg.importer import import_file
-import annpkg.gst_numpy as gst_numpy
+from ticks import StepLocator,StepFormatter,step_for
 import src_loader_gui
-import gst
+startup.mark("application modules")
+
+def sample_period(src):
+    """
+    :param src: The source
+    :type src: :class:`sources.Source`
+    :returns: The median distance of the first samples in days, :const:`None` if the source has less than two samples
+    :rtype: :class:`float`"""
+    times = src.get_time(True)[:1025]
+    if len(times) < 2:
+        return None
+    diffs = times[1:]-times[:-1]
+    diffs.sort()
+    return float(diffs[len(diffs)//2])
 
 class CtxAnnotator(gtk.VBox):
-    def __init__(self):
+    """
+    :param multitrack: Whether all sources are shown in one display, see :func:`set_multitrack`
+    :type multitrack: :class:`bool`
+
+    .. attribute:: displays
+
+       The tracks of all shown sources (see :class:`display.Track`).
+
+    .. attribute:: previews
+
+       The tracks of sources that are still being loaded, shown by their placeholders (see :func:`update_placeholder`).
+
+    .. attribute:: min_samples
+
+       The number of samples of the fastest source that the narrowest window shows.
+
+    .. attribute:: feature_window
+
+       The length in seconds of the windows over which features are computed (see :mod:`features`).
+    """
+    min_samples = 10
+    feature_window = 1.0
+    def __init__(self,multitrack=False):
+        from prefetch import Prefetcher
         self.policy = ScalePolicy()
         self.displays = []
+        self.previews = []
+        self.frames = dict()
+        self.multitrack = multitrack
+        self.multitrack_display = None
+        self.minimap = None
+        self.feature = None
         self.xmax = None
         self.xmin = None
-        self.annotations = Annotations()
+        self.time_bounds = dict()
+        self.sample_periods = dict()
+        self.source_bounds = (None,None)
+        self.journal = None
+        self.prefetcher = Prefetcher()
+        self.prefetcher.start()
+        self.annotations = GAnnotations()
         self.annotations.connect('context-added',self.add_context_button)
         self.annotations.connect('context-removed',self.remove_context_button)
         self.buttons = dict()
@@ -58,7 +138,7 @@ class CtxAnnotator(gtk.VBox):
         scr_win.set_policy(gtk.POLICY_NEVER,gtk.POLICY_AUTOMATIC)
 
         self.adjustment = gtk.Adjustment()
-        self.adjustment.connect('value-changed',self.update_pos)
+        self.pos_handler = self.adjustment.connect('value-changed',self.update_pos)
         self.scroller = gtk.HScrollbar(self.adjustment)
         self.scroller.hide()
         gtk.VBox.__init__(self)
@@ -67,8 +147,12 @@ class CtxAnnotator(gtk.VBox):
         self.pack_end(self.context_box,expand=False,fill=True)
     def update_pos(self,adj):
         self.policy.update_pos(adj.value)
-        for d in self.displays:
+        direction = self.prefetcher.observe(adj.value)
+        for d in self.canvases():
             d.update_zoom(self.policy)
+        if self.minimap is not None:
+            self.minimap.update_zoom(self.xmin,self.xmax,self.policy)
+        self.prefetcher.request([d.prefetch_job(direction) for d in self.canvases()])
     def find_annotation(self,x):
         hits = self.annotations.find_annotation(x)
         if len(hits) is 0:
@@ -81,17 +165,39 @@ class CtxAnnotator(gtk.VBox):
     def smaller(self):
         self.policy.smallerx()
         self.update_zoom()
+    def zoom(self,factor,center=None):
+        """
+        :param factor: The factor by which the width of the window is multiplied
+        :type factor: :class:`float`
+        :param center: The time that should stay in place, the middle of the window if :const:`None`
+        :type center: :class:`float`
+
+        Zooms continuously, e.g. with the mouse wheel (see :func:`ScalePolicy.zoom`)."""
+        self.policy.zoom(factor,center)
+        self.update_zoom()
+    def zoom_request(self,disp,x,steps):
+        self.zoom(self.policy.wheel_step**(-steps),x)
+    def position_request(self,minimap,x):
+        self.policy.update_pos(x-self.policy.get_window()/2)
+        self.update_zoom()
     def update_zoom(self):
         if self.xmax is None:
             self.scroller.hide()
+            if self.minimap is not None:
+                self.minimap.hide()
             return
         max = self.xmax - self.policy.get_window()
+        value = self.policy.pos
+        if value is None or max < value:
+            value = max
+        if self.xmin > value:
+            value = self.xmin
+        self.policy.update_pos(value)
+        self.adjustment.handler_block(self.pos_handler)
         self.adjustment.lower = self.xmin
         self.adjustment.upper = max
-        if max < self.adjustment.value:
-            self.adjustment.value = max
-        if self.xmin > self.adjustment.value:
-            self.adjustment.value = self.xmin
+        self.adjustment.value = value
+        self.adjustment.handler_unblock(self.pos_handler)
         if self.xmin < max:
             self.scroller.show()
         else:
@@ -99,53 +205,276 @@ class CtxAnnotator(gtk.VBox):
         self.adjustment.step_increment = self.policy.get_steps()
         self.adjustment.page_increment = self.policy.get_pages()
         self.adjustment.changed()
-        for d in self.displays:
+        self.prefetcher.reset()
+        for d in self.canvases():
             d.update_zoom(self.policy)
+        if self.minimap is not None:
+            self.minimap.show()
+            self.minimap.update_zoom(self.xmin,self.xmax,self.policy)
+        self.prefetcher.request([d.prefetch_job(0) for d in self.canvases()])
+    def canvases(self):
+        """
+        :returns: The displays that show the tracks, each only once
+        :rtype: \[ :class:`display.Display` \]"""
+        res = []
+        for track in self.displays+self.previews:
+            if track.display not in res:
+                res.append(track.display)
+        return res
             
+    def add_time_bounds(self,disp):
+        """
+        Remembers the time bounds and the sample period of a new display and extends the combined bounds of all sources."""
+        min,max = disp.src.get_time_bounds()
+        self.time_bounds[disp] = (min,max)
+        self.sample_periods[disp] = sample_period(disp.src)
+        xmin,xmax = self.source_bounds
+        if xmin is None or min < xmin:
+            xmin = min
+        if xmax is None or max > xmax:
+            xmax = max
+        self.source_bounds = (xmin,xmax)
+    def remove_time_bounds(self,disp):
+        """
+        Forgets the time bounds of a removed display. The combined bounds are only recomputed (from the remembered bounds) if the display defined one of them."""
+        min,max = self.time_bounds.pop(disp)
+        del self.sample_periods[disp]
+        xmin,xmax = self.source_bounds
+        if min == xmin or max == xmax:
+            xmin = None
+            xmax = None
+            for (min,max) in self.time_bounds.itervalues():
+                if xmin is None or min < xmin:
+                    xmin = min
+                if xmax is None or max > xmax:
+                    xmax = max
+            self.source_bounds = (xmin,xmax)
     def recalculate(self):
-        xmin = None
-        xmax = None
-        for d in self.displays:
-            min,max = d.src.get_time_bounds()
-            if xmin is None or min < xmin:
-                xmin = min
-            if xmax is None or max > xmax:
-                xmax = max
+        xmin,xmax = self.source_bounds
         ann_l,ann_r = self.annotations.bounds()
-        if ann_l is not None and ann_l < xmin:
+        if ann_l is not None and (xmin is None or ann_l < xmin):
             xmin = ann_l
-        if ann_r is not None and ann_r > xmax:
+        if ann_r is not None and (xmax is None or ann_r > xmax):
             xmax = ann_r
         self.xmin = xmin
         self.xmax = xmax
         if xmin is not None:
             self.policy.update_min(xmin)
+            periods = [p for p in self.sample_periods.itervalues() if p is not None]
+            if len(periods) > 0:
+                min_window = self.min_samples*min(periods)
+            else:
+                min_window = seconds(1)
+            self.policy.set_limits(min_window,xmax-xmin)
         self.update_zoom()
 
     def add_source(self,src):
-        disp = Display(src,self.annotations,self.input_state)
-        self.displays.append(disp)
-        frame = gtk.Table(3,2)
-        cont = gtk.Frame()
-        cont.set_shadow_type(gtk.SHADOW_ETCHED_OUT)
-        cont.add(disp)
-        frame.attach(cont,0,1,1,3,gtk.EXPAND|gtk.FILL,gtk.EXPAND|gtk.FILL)
-        lbl = gtk.Label()
-        lbl.set_markup("<b>"+src.get_name()+"</b>")
-        lbl.set_alignment(0.0,0.5)
-        frame.attach(lbl,0,1,0,1,gtk.EXPAND|gtk.FILL,gtk.SHRINK|gtk.FILL)
-        rem_but = gtk.Button()
+        self.add_sources([src])
+    def add_sources(self,sources,pyramids=None):
+        """
+        :param sources: The sources to add
+        :type sources: \[ :class:`sources.Source` \]
+        :param pyramids: The level of detail summaries of the sources, built by :func:`loader.prepare_sources`
+        :type pyramids: \[ :class:`lod.DecimationPyramid` \]
+
+        Adds a display for every source. The time bounds are recalculated once all displays are added."""
+        if pyramids is None:
+            pyramids = [None]*len(sources)
+        for (src,pyramid) in zip(sources,pyramids):
+            self.__add_display(src,pyramid)
+        self.recalculate()
+    def load_sources(self,sources):
+        """
+        :param sources: The sources to add
+        :type sources: \[ :class:`sources.Source` \]
+
+        Decodes the data of all sources in parallel before adding them."""
+        from loader import prepare_sources
+        self.add_sources(sources,prepare_sources(sources))
+    def __add_display(self,src,pyramid):
+        from display import Display
+        if self.multitrack_display is not None:
+            frame = self.frames[self.multitrack_display.tracks[0]]
+            track = self.multitrack_display.add_track(src,pyramid)
+            self.__add_track_button(frame,track)
+        else:
+            disp = Display(src,self.annotations,self.input_state,pyramid)
+            disp.connect('zoom-request',self.zoom_request)
+            track = disp.tracks[0]
+            cont = gtk.Frame()
+            cont.set_shadow_type(gtk.SHADOW_ETCHED_OUT)
+            cont.add(disp)
+            if self.multitrack:
+                frame = gtk.VBox()
+                frame.buttons = gtk.HBox()
+                frame.pack_start(frame.buttons,expand=False,fill=True)
+                frame.pack_start(cont,expand=True,fill=True)
+                self.multitrack_display = disp
+                self.__add_track_button(frame,track)
+            else:
+                frame = gtk.Table(3,2)
+                frame.attach(cont,0,1,1,3,gtk.EXPAND|gtk.FILL,gtk.EXPAND|gtk.FILL)
+                lbl = gtk.Label()
+                lbl.set_markup("<b>"+src.get_name()+"</b>")
+                lbl.set_alignment(0.0,0.5)
+                frame.attach(lbl,0,1,0,1,gtk.EXPAND|gtk.FILL,gtk.SHRINK|gtk.FILL)
+                rem_but = gtk.Button()
+                rem_but.set_image(gtk.image_new_from_stock(gtk.STOCK_DELETE,gtk.ICON_SIZE_MENU))
+                rem_but.connect('clicked',self.remove_source_handler,frame,track)
+                frame.attach(rem_but,1,2,1,2,gtk.SHRINK|gtk.FILL,gtk.SHRINK|gtk.FILL)
+                frame.attach(gtk.VBox(),1,2,2,3,gtk.SHRINK,gtk.EXPAND)
+            frame.show_all()
+            self.display_box.pack_start(frame,expand=True,fill=True)
+        self.frames[track] = frame
+        self.displays.append(track)
+        self.add_time_bounds(track)
+        if self.minimap is None:
+            from minimap import Minimap
+            self.minimap = Minimap(self.annotations)
+            self.minimap.connect('position-request',self.position_request)
+            self.pack_start(self.minimap,expand=False,fill=True)
+            self.reorder_child(self.minimap,0)
+        self.minimap.add_source(src)
+        if self.feature is not None:
+            FeatureWorker([src],self.feature_window,self.feature_dir(),self.features_ready).start()
+    def __add_track_button(self,frame,track):
+        rem_but = gtk.Button(track.src.get_name())
         rem_but.set_image(gtk.image_new_from_stock(gtk.STOCK_DELETE,gtk.ICON_SIZE_MENU))
-        rem_but.connect('clicked',self.remove_source_handler,frame,disp)
-        frame.attach(rem_but,1,2,1,2,gtk.SHRINK|gtk.FILL,gtk.SHRINK|gtk.FILL)
-        frame.attach(gtk.VBox(),1,2,2,3,gtk.SHRINK,gtk.EXPAND)
-        frame.show_all()
-        self.display_box.pack_start(frame,expand=True,fill=True)
+        rem_but.set_relief(gtk.RELIEF_NONE)
+        rem_but.connect('clicked',self.remove_source_handler,frame,track)
+        rem_but.show()
+        frame.buttons.pack_start(rem_but,expand=False,fill=True)
+    def set_multitrack(self,enabled):
+        """
+        :param enabled: Whether all sources should be shown in one display
+        :type enabled: :class:`bool`
+
+        Switches between one display per source and a single display in which the sources are stacked as tracks
+        (see :class:`display.Display`). In the latter, scrolling or zooming renders only one figure.
+        Sources that are still being loaded keep their previews until they are added.
+        The old displays are destroyed, which disconnects them from the annotations and the input state (see :func:`display.Display.on_destroy`)."""
+        if enabled == self.multitrack:
+            return
+        tracks = list(self.displays)
+        for disp in set(track.display for track in tracks):
+            disp.destroy()
+        for frame in set(self.frames.itervalues()):
+            self.display_box.remove(frame)
+            frame.destroy()
+        for track in tracks:
+            self.displays.remove(track)
+            self.remove_time_bounds(track)
+            self.minimap.remove_source(track.src)
+        self.frames = dict()
+        self.multitrack = enabled
+        self.multitrack_display = None
+        self.add_sources([track.src for track in tracks],[track.pyramid for track in tracks])
+    def feature_dir(self):
+        """
+        :returns: The directory in which the features of the sources are cached, next to the package once it has been saved
+        :rtype: :class:`str`"""
+        import features
+        return features.cache_dir(None if self.journal is None else self.journal.fn)
+    def set_feature(self,name):
+        """
+        :param name: The feature to show over the data of every source, one of :data:`features.FEATURES`, or :const:`None` to show none
+        :type name: :class:`str`
+
+        The features are computed in the background (or read from the cache) and shown once they are ready."""
+        self.feature = name
+        if name is None:
+            for track in self.displays:
+                track.set_features(None,None)
+            for d in self.canvases():
+                d.draw_idle()
+        else:
+            FeatureWorker([track.src for track in self.displays],self.feature_window,
+                          self.feature_dir(),self.features_ready).start()
+    def features_ready(self,src,feats):
+        if self.feature is None:
+            return False
+        for track in self.displays:
+            if track.src is src:
+                track.set_features(feats['time'],feats[self.feature])
+                track.display.update_lines()
+        return False
+    def suggest_annotations(self,name='energy'):
+        """
+        :param name: The feature to look at, see :func:`features.suggest`
+        :type name: :class:`str`
+
+        Adds the segments in which a feature of a source stands out as annotations of the context "Suggestions"."""
+        import features
+        def ready(src,feats):
+            segments = features.suggest(feats,name)
+            if len(segments) > 0:
+                ctx = _("Suggestions")
+                with self.annotations.batch():
+                    self.annotations.add_context(ctx)
+                    for (start,end) in segments:
+                        self.annotations.add_annotation(ctx,start,end)
+            return False
+        FeatureWorker([track.src for track in self.displays],self.feature_window,
+                      self.feature_dir(),ready).start()
+    def add_placeholder(self,name):
+        """
+        :param name: The name of the source that is being loaded
+        :type name: :class:`str`
+        :rtype: :class:`SourcePlaceholder`
+
+        Shows a placeholder for a source that is still being loaded."""
+        placeholder = SourcePlaceholder(name)
+        placeholder.show_all()
+        self.display_box.pack_start(placeholder,expand=True,fill=True)
+        return placeholder
+    def update_placeholder(self,placeholder,fraction,sources=None):
+        """
+        :param fraction: The fraction loaded so far
+        :type fraction: :class:`float`
+        :param sources: The partially loaded sources or :const:`None`
+        :type sources: \[ :class:`sources.Source` \]
+
+        Updates the progress of a placeholder and shows the data loaded so far."""
+        placeholder.set_fraction(fraction)
+        if sources is None:
+            return
+        if len(placeholder.tracks) == len(sources):
+            for (track,src) in zip(placeholder.tracks,sources):
+                self.remove_time_bounds(track)
+                track.set_source(src)
+                self.add_time_bounds(track)
+        else:
+            from display import Display
+            self.clear_placeholder(placeholder)
+            for src in sources:
+                track = Display(src,self.annotations,self.input_state).tracks[0]
+                placeholder.add_track(track)
+                self.previews.append(track)
+                self.add_time_bounds(track)
         self.recalculate()
-    def remove_source_handler(self,but,frame,display):
-        self.display_box.remove(frame)
-        self.displays.remove(display)
-        frame.destroy()
+    def clear_placeholder(self,placeholder):
+        for track in placeholder.tracks:
+            self.previews.remove(track)
+            self.remove_time_bounds(track)
+        placeholder.clear()
+    def remove_placeholder(self,placeholder):
+        self.clear_placeholder(placeholder)
+        self.display_box.remove(placeholder)
+        placeholder.destroy()
+        self.recalculate()
+    def remove_source_handler(self,but,frame,track):
+        del self.frames[track]
+        self.displays.remove(track)
+        self.remove_time_bounds(track)
+        self.minimap.remove_source(track.src)
+        if len(track.display.tracks) > 1:
+            track.display.remove_track(track)
+            but.destroy()
+        else:
+            if track.display is self.multitrack_display:
+                self.multitrack_display = None
+            self.display_box.remove(frame)
+            frame.destroy()
         self.recalculate()
     def add_context(self,name):
         self.annotations.add_context(name)
@@ -190,28 +519,78 @@ class CtxAnnotator(gtk.VBox):
     def remove_annotation(self,id):
         self.annotations.remove_annotation(id)
     def write_out(self,fn):
-        pkg = AnnPkg([(disp.src,None) for disp in self.displays],
-                     [ann for ann in self.annotations])
-        pkg.write(fn)
-            
+        """
+        :param fn: The name of the annotation package
+        :type fn: :class:`str`
+
+        Saves sources and annotations, so that every reader of the package sees the current annotations.
+        If the package holds the current sources already, only its annotations are replaced (see :func:`blobcache.rewrite_annotations`),
+        otherwise it is written anew and its sources are put into the cache in the background.
+        The journal of the package is emptied, as the package now holds all of its changes."""
+        from annpkg.model import AnnPkg
+        from journal import Journal
+        import blobcache
+        sources = [disp.src for disp in self.displays]
+        if not blobcache.rewrite_annotations(fn,sources,self.annotations):
+            pkg = AnnPkg([(blobcache.original(src),None) for src in sources],
+                         [ann for ann in self.annotations])
+            pkg.write(fn)
+            blobcache.CacheWriter(fn,sources).start()
+        if self.journal is not None and self.journal.fn == fn:
+            self.journal.reset()
+        else:
+            self.close_journal()
+            self.journal = Journal(self.annotations,fn,self.checkpoint)
+            self.journal.start()
     def read_in(self,fn):
+        """
+        :param fn: The name of the annotation package
+        :type fn: :class:`str`
+
+        Loads sources and annotations of a package and replays its journal.
+        Sources that are in the local cache are not decoded from the package again.
+        If other annotations or sources were shown already, the package is merged into them and its journal
+        is not continued, so the merged annotations only reach the package when it is saved explicitly."""
+        from annpkg.model import AnnPkg
+        from journal import Journal
+        import blobcache
+        pristine = len(self.displays) == 0 and len(self.previews) == 0 and len(self.annotations) == 0
         pkg = AnnPkg.load(fn)
-        for (name,start,end) in pkg.annotations:
-            self.annotations.add_annotation(name,start,end)
-        for (src,anns) in pkg.sources:
-            if src is not None:
-                self.add_source(src)
-    def export(self,fn,cb=None,end_cb=None):
-        pkg = AnnPkg([(disp.src,None) for disp in self.displays],
-                     [ann for ann in self.annotations])
-        pkg.export(fn,cb,end_cb)
+        self.close_journal()
+        sources = blobcache.restore(fn,[src for (src,anns) in pkg.sources if src is not None])
+        self.annotations.add_annotations(pkg.annotations)
+        self.journal = Journal(self.annotations,fn,self.checkpoint)
+        self.journal.replay()
+        self.load_sources(sources)
+        if pristine:
+            if not all(isinstance(src,blobcache.CachedSource) for src in sources):
+                blobcache.CacheWriter(fn,sources).start()
+            self.journal.start()
+        else:
+            self.journal = None
+    def checkpoint(self):
+        """
+        :returns: Whether the annotations could be saved without writing the sources again
+        :rtype: :class:`bool`
+
+        Saves the annotations to the package of the journal, called by the journal once it has grown long
+        (see :class:`journal.Journal`)."""
+        import blobcache
+        return blobcache.rewrite_annotations(self.journal.fn,[disp.src for disp in self.displays],self.annotations)
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+    def export(self,fn,cb=None,end_cb=None,error_cb=None):
+        from exporter import ExportWriter
+        writer = ExportWriter(fn,[disp.src for disp in self.displays],
+                              self.annotations.columns(),cb,end_cb,error_cb,encoders)
+        writer.start()
     def importer(self,fn):
+        from annpkg.importer import import_file
         pkg = import_file(fn)
-        for (name,start,end) in pkg.annotations:
-            self.annotations.add_annotation(name,start,end)
-        for (src,anns) in pkg.sources:
-            if src is not None:
-                self.add_source(src)
+        self.annotations.add_annotations(pkg.annotations)
+        self.load_sources([src for (src,anns) in pkg.sources if src is not None])
     def read_annotations(self,fn):
         try:
             self.annotations.read(fn)
@@ -222,23 +601,104 @@ class CtxAnnotator(gtk.VBox):
             warning.run()
             warning.destroy()
 
+class SourcePlaceholder(gtk.VBox):
+    """
+    :param name: The name of the source that is being loaded
+    :type name: :class:`str`
+
+    Takes the place of a source while it is loaded. Shows the progress and previews of the data loaded so far.
+    """
+    def __init__(self,name):
+        gtk.VBox.__init__(self)
+        self.tracks = []
+        lbl = gtk.Label()
+        lbl.set_markup("<b>"+name+"</b> ("+_("loading")+")")
+        lbl.set_alignment(0.0,0.5)
+        self.bar = gtk.ProgressBar()
+        self.previews = gtk.VBox()
+        self.pack_start(lbl,expand=False,fill=True)
+        self.pack_start(self.bar,expand=False,fill=True)
+        self.pack_start(self.previews,expand=True,fill=True)
+    def set_fraction(self,fraction):
+        self.bar.set_fraction(fraction)
+    def add_track(self,track):
+        cont = gtk.Frame()
+        cont.set_shadow_type(gtk.SHADOW_ETCHED_OUT)
+        cont.add(track.display)
+        cont.show_all()
+        self.previews.pack_start(cont,expand=True,fill=True)
+        self.tracks.append(track)
+    def clear(self):
+        for cont in self.previews.get_children():
+            self.previews.remove(cont)
+            cont.destroy()
+        self.tracks = []
+
+class FeatureWorker(threading.Thread):
+    """
+    :param sources: The sources whose features are needed
+    :type sources: \[ :class:`sources.Source` \]
+    :param window: The length of a window in seconds
+    :type window: :class:`float`
+    :param directory: The cache directory, see :func:`features.cache_dir`
+    :type directory: :class:`str`
+    :param cb: Called in the main loop with every source and its features once they are ready
+    :type cb: :func:`callable`
+
+    Gets the features of many sources in the background, see :func:`features.features`."""
+    def __init__(self,sources,window,directory,cb):
+        threading.Thread.__init__(self,name="feature thread")
+        self.daemon = True
+        self.sources = list(sources)
+        self.window = window
+        self.directory = directory
+        self.cb = cb
+    def run(self):
+        import features
+        for src in self.sources:
+            feats = features.features(src,self.window,self.directory)
+            gobject.idle_add(self.cb,src,feats)
+
 class ScalePolicy:
+    """
+    Decides which time window is shown. The width of the window can be changed continuously
+    between :attr:`min_window` and :attr:`max_window`, the ticks are chosen to fit it (see :func:`ticks.step_for`).
+
+    .. attribute:: zoom_step
+
+       The factor by which :func:`biggerx` and :func:`smallerx` change the width of the window.
+
+    .. attribute:: wheel_step
+
+       The factor by which one step of the mouse wheel changes the width of the window.
+
+    .. attribute:: min_window
+
+       The narrowest window in days, set from the sample period of the sources by :class:`CtxAnnotator`.
+
+    .. attribute:: max_window
+
+       The widest window in days, set from the length of the recording by :class:`CtxAnnotator`.
+    """
+    zoom_step = 2.0
+    wheel_step = 1.25
     def __init__(self):
-        self.scales = [(_("Hour"),hours(1),MinuteLocator(interval=10)),
-                       (_("Half-hour"),minutes(30),MinuteLocator(interval=5)),
-                       (_("10-Minute"),minutes(10),MinuteLocator(interval=2)),
-                       (_("5-Minute"),minutes(5),MinuteLocator(interval=1)),
-                       (_("2-Minute"),minutes(2),SecondLocator(interval=20)),
-                       (_("Minute"),minutes(1),SecondLocator(interval=10)),
-                       (_("30-Seconds"),minutes(0.5),SecondLocator(interval=5)),
-                       (_("12-Seconds"),minutes(0.2),SecondLocator(interval=2))
-                       ]
-        self.cur = 0
+        self.window = hours(1)
+        self.min_window = seconds(1)
+        self.max_window = hours(1)
+        self.ticks = dict()
         self.pos = None
     def get_window(self):
-        return self.scales[self.cur][1]
+        return self.window
+    def _ticks(self):
+        step = step_for(self.window)
+        if step not in self.ticks:
+            self.ticks[step] = (StepLocator(step),StepFormatter(step))
+        return self.ticks[step]
     def get_locator(self):
-        return self.scales[self.cur][2]
+        return self._ticks()[0]
+    def get_formatter(self):
+        return self._ticks()[1]
     def get_steps(self):
         return self.get_window()/100
     def get_pages(self):
@@ -253,12 +713,31 @@ class ScalePolicy:
             self.pos = npos
     def update_pos(self,pos):
         self.pos = pos
+    def set_limits(self,min_window,max_window):
+        """
+        :param min_window: The narrowest window in days
+        :type min_window: :class:`float`
+        :param max_window: The widest window in days
+        :type max_window: :class:`float`"""
+        self.min_window = min_window
+        self.max_window = max(min_window,max_window)
+        self.window = min(max(self.window,self.min_window),self.max_window)
+    def zoom(self,factor,center=None):
+        """
+        :param factor: The factor by which the width of the window is multiplied
+        :type factor: :class:`float`
+        :param center: The time that should stay in place, the middle of the window if :const:`None`
+        :type center: :class:`float`"""
+        old = self.window
+        self.window = min(max(old*factor,self.min_window),self.max_window)
+        if self.pos is not None:
+            if center is None:
+                center = self.pos+old/2
+            self.pos = center-(center-self.pos)*self.window/old
     def biggerx(self):
-        if self.cur+1 < len(self.scales):
-            self.cur+=1
+        self.zoom(1/self.zoom_step)
     def smallerx(self):
-        if self.cur > 0:
-            self.cur-=1
+        self.zoom(self.zoom_step)
 
 class ContextButton(gtk.HBox):
     def __init__(self,name,color,par):
@@ -303,6 +782,8 @@ class SelectionMenu(gtk.Menu):
                             num2date(end,UTC()))
             self.append(play_it)
     def play_annotation(self,menu,window,display,start,end):
+        import gst
+        import annpkg.gst_numpy as gst_numpy
         pipe = gst.Pipeline()
         (data,rate) = display.src.getPlayData(start,end)
         src = gst_numpy.NumpySrc(data,rate)
@@ -319,6 +800,8 @@ class SelectionMenu(gtk.Menu):
 
 class PlayProgress(gtk.Window,threading.Thread):
     def __init__(self,parent,pipe,offset,len):
+        import gst
+        self.gst = gst
         gtk.Window.__init__(self)
         self.set_transient_for(parent)
         self.set_default_size(400,80)
@@ -346,27 +829,27 @@ class PlayProgress(gtk.Window,threading.Thread):
         diff = datetime.timedelta(microseconds=value/1000)
         return (self.offset+diff).strftime("%c, %fus")
     def seek(self,scale,act,value):
-        self.pipe.seek_simple(gst.FORMAT_TIME,gst.SEEK_FLAG_FLUSH,value)
+        self.pipe.seek_simple(self.gst.FORMAT_TIME,self.gst.SEEK_FLAG_FLUSH,value)
     def message(self,bus,msg):
-        if msg.type == gst.MESSAGE_EOS:
+        if msg.type == self.gst.MESSAGE_EOS:
             self.pause()
     def run(self):
         while(self.thread_active):
             time.sleep(0.2)
             self.playing.wait()
             try:
-                val = self.pipe.query_position(gst.FORMAT_TIME)[0]
+                val = self.pipe.query_position(self.gst.FORMAT_TIME)[0]
                 gtk.gdk.threads_enter()
                 self.scale.set_value(val)
                 gtk.gdk.threads_leave()
             except:
                 pass
     def play(self):
-        self.pipe.set_state(gst.STATE_PLAYING)
+        self.pipe.set_state(self.gst.STATE_PLAYING)
         self.playing.set()
         self.button.set_label(_("Pause"))
     def pause(self):
-        self.pipe.set_state(gst.STATE_PAUSED)
+        self.pipe.set_state(self.gst.STATE_PAUSED)
         self.playing.clear()
         self.button.set_label(_("Play"))
     def clicked(self,but):
@@ -375,7 +858,7 @@ class PlayProgress(gtk.Window,threading.Thread):
         else:
             self.play()
     def do_destroy(self,win):
-        self.pipe.set_state(gst.STATE_NULL)
+        self.pipe.set_state(self.gst.STATE_NULL)
         self.pipe = None
         self.thread_active = False
         self.playing.set()
@@ -392,7 +875,7 @@ class Application(gtk.Window):
         gtk.Window.__init__(self)
         accel = gtk.AccelGroup()
         self.add_accel_group(accel)
-        self.connect("destroy", lambda x: gtk.main_quit())
+        self.connect("destroy", lambda x: self.quit())
 
         self.set_default_size(800,600)
         self.set_title(_("Context Annotator"))
@@ -420,7 +903,10 @@ class Application(gtk.Window):
         #file_menu.append(open_annotations_item)
         file_menu.append(save_item)
         file_menu.append(export_item)
+        suggest_item = gtk.MenuItem(_('Suggest annotations'))
+        suggest_item.connect('activate',lambda x: self.annotator.suggest_annotations())
         file_menu.append(import_item)
+        file_menu.append(suggest_item)
         
         
         source_item = gtk.MenuItem(label=_('_Sources'))
@@ -441,8 +927,23 @@ class Application(gtk.Window):
         zoom_out_item = gtk.ImageMenuItem(gtk.STOCK_ZOOM_OUT)
         zoom_out_item.connect('activate',lambda x: self.annotator.smaller())
         zoom_out_item.add_accelerator("activate",accel,45,gtk.gdk.CONTROL_MASK,gtk.ACCEL_VISIBLE)
+        multitrack_item = gtk.CheckMenuItem(_('One figure for all sources'))
+        multitrack_item.set_active('--multitrack' in sys.argv)
+        multitrack_item.connect('toggled',lambda x: self.annotator.set_multitrack(x.get_active()))
         view_menu.append(zoom_in_item)
         view_menu.append(zoom_out_item)
+        view_menu.append(multitrack_item)
+        feature_item = gtk.MenuItem(_('Features'))
+        feature_menu = gtk.Menu()
+        feature_item.set_submenu(feature_menu)
+        group = None
+        for (name,label) in [(None,_('None')),('mean',_('Mean')),('var',_('Variance')),
+                             ('energy',_('Energy')),('zcr',_('Zero-crossing rate'))]:
+            it = gtk.RadioMenuItem(group,label)
+            group = it
+            it.connect('toggled',self.select_feature,name)
+            feature_menu.append(it)
+        view_menu.append(feature_item)
 
         help_item = gtk.MenuItem(label=_('_Help'))
         bar.append(help_item)
@@ -459,10 +960,16 @@ class Application(gtk.Window):
 
         self.add(layout)
         
-        self.annotator = CtxAnnotator()
+        self.annotator = CtxAnnotator('--multitrack' in sys.argv)
         self.annotator.input_state.connect('message-changed',self.set_message)
         layout.pack_start(self.annotator,expand=True,fill=True)
         layout.pack_start(self.status,expand=False,fill=True)
+    def quit(self):
+        self.annotator.close_journal()
+        gtk.main_quit()
+    def select_feature(self,item,name):
+        if item.get_active():
+            self.annotator.set_feature(name)
     def set_message(self,state,str):
         ctx = self.status.get_context_id("coords")
         self.status.push(ctx,str)
@@ -512,7 +1019,15 @@ class Application(gtk.Window):
             bar = gtk.ProgressBar()
             progress.add(bar)
             progress.show_all()
-            self.annotator.export(dialog.get_filename(),lambda prog: gobject.idle_add(bar.set_fraction,prog),lambda: gobject.idle_add(progress.destroy))
+            def failed(e):
+                warning = gtk.MessageDialog(type=gtk.MESSAGE_ERROR,
+                                            buttons=gtk.BUTTONS_OK,
+                                            message_format=_("Export failed: %s") % e)
+                warning.run()
+                warning.destroy()
+                return False
+            self.annotator.export(dialog.get_filename(),lambda prog: gobject.idle_add(bar.set_fraction,prog),lambda: gobject.idle_add(progress.destroy),
+                                  lambda e: gobject.idle_add(failed,e))
         dialog.destroy()
     def importer(self):
         dialog = gtk.FileChooserDialog(title=_("Import file"),
@@ -523,23 +1038,48 @@ class Application(gtk.Window):
             self.annotator.importer(dialog.get_filename())
         dialog.destroy()
     def load_source(self):
-        dialog = src_loader_gui.LoadSourceDialog(all_sources)
+        from annpkg.sources import all_sources
+        from loader import SourceLoader
+        from memmapsource import MemmapSource
+        dialog = src_loader_gui.LoadSourceDialog(all_sources+[MemmapSource])
         response = dialog.run()
-        if response == gtk.RESPONSE_OK:
-            try:
-                for src in dialog.get_source():
-                    self.annotator.add_source(src)
-            except Exception as e:
-                warning = gtk.MessageDialog(type=gtk.MESSAGE_ERROR,
-                                            buttons=gtk.BUTTONS_OK,
-                                            message_format=str(e))
-                warning.run()
-                warning.destroy()
-        dialog.destroy()
+        if response != gtk.RESPONSE_OK:
+            dialog.destroy()
+            return
+        (src,fn,name,args) = dialog.get_arguments()
+        placeholder = self.annotator.add_placeholder(name)
+        def progress(fraction,sources):
+            dialog.set_progress(fraction)
+            self.annotator.update_placeholder(placeholder,fraction,sources)
+        def finished(sources,pyramids):
+            dialog.destroy()
+            self.annotator.remove_placeholder(placeholder)
+            self.annotator.add_sources(sources,pyramids)
+        def failed(e):
+            dialog.destroy()
+            self.annotator.remove_placeholder(placeholder)
+            warning = gtk.MessageDialog(type=gtk.MESSAGE_ERROR,
+                                        buttons=gtk.BUTTONS_OK,
+                                        message_format=str(e))
+            warning.run()
+            warning.destroy()
+        def cancel(dialog,response):
+            loader.cancel()
+            dialog.destroy()
+            self.annotator.remove_placeholder(placeholder)
+        loader = SourceLoader(src,fn,name,args,progress,finished,failed)
+        dialog.connect('response',cancel)
+        dialog.show_progress()
+        loader.start()
     def run(self):
         self.show_all()
         self.annotator.update_zoom()
+        startup.mark("window shown")
+        gobject.idle_add(self.startup_done)
         gtk.main()
+    def startup_done(self):
+        startup.mark("first idle")
+        return startup.report()
     def show_about(self):
         dialog = gtk.AboutDialog()
         dialog.set_name(_("Context Annotator"))
@@ -566,4 +1106,5 @@ Public License along with this program; if not, see\n\
 if __name__=="__main__":
     gtk.gdk.threads_init()
     app = Application()
+    startup.mark("window created")
     app.run()
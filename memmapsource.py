@@ -0,0 +1,287 @@
+"""
+Memory-mapped sources
+=====================
+"""
+import os
+import struct
+import hashlib
+import threading
+import numpy as np
+from matplotlib.dates import date2num
+from annotation import unix2num
+from lod import decimate
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME',os.path.expanduser(os.path.join('~','.cache'))),
+                         'context-annotator')
+
+MAGIC = 'CTXMMAP1'
+HEADER_SIZE = 4096
+HEADER = struct.Struct('<8sqqqqd')
+BLOCK_SIZE = 16*1024*1024
+
+def cache_file(fn):
+    """
+    :param fn: The name of the log file
+    :type fn: :class:`str`
+    :returns: The name of the cache file for the log
+    :rtype: :class:`str`"""
+    st = os.stat(fn)
+    key = hashlib.sha1("%s\0%d\0%f" % (os.path.abspath(fn),st.st_size,st.st_mtime)).hexdigest()
+    return os.path.join(CACHE_DIR,key+'.mmap')
+
+def count_lines(fn):
+    """
+    Counts the lines of a file without parsing them."""
+    lines = 0
+    last = '\n'
+    with open(fn,'rb') as h:
+        while True:
+            block = h.read(BLOCK_SIZE)
+            if not block:
+                break
+            lines += block.count('\n')
+            last = block[-1]
+    if last != '\n':
+        lines += 1
+    return lines
+
+def read_blocks(fn):
+    """
+    Reads a file in big blocks that end at line boundaries."""
+    rest = ''
+    with open(fn,'rb') as h:
+        while True:
+            block = h.read(BLOCK_SIZE)
+            if not block:
+                break
+            block = rest+block
+            cut = block.rfind('\n')+1
+            rest = block[cut:]
+            yield block[:cut]
+    if rest.strip():
+        yield rest+'\n'
+
+def convert(fn,target,channels=6,progress=None):
+    """
+    :param fn: The name of the log file
+    :type fn: :class:`str`
+    :param target: The name of the cache file to create
+    :type target: :class:`str`
+    :param channels: The number of data columns in the log
+    :type channels: :class:`int`
+    :param progress: Called after every block with the fraction converted so far, the timestamps, the samples and the minima and maxima converted so far.
+                     It may raise an exception to abort the conversion.
+    :type progress: :func:`callable`
+
+    Converts a movement log into a cache file. Every line of the log holds
+    seconds and microseconds since 1.1.1970 followed by *channels* integer samples.
+
+    The cache file starts with a header of :const:`HEADER_SIZE` bytes, followed by the
+    timestamps as matplotlib date numbers and one column of 32-bit integers per channel."""
+    size = count_lines(fn)
+    if size == 0:
+        raise IOError(fn+" contains no samples")
+    tmp = target+'.tmp'
+    times = None
+    data = None
+    lows = np.zeros(channels)
+    highs = np.zeros(channels)
+    rows = 0
+    try:
+        with open(tmp,'wb') as h:
+            h.truncate(HEADER_SIZE+size*(8+4*channels))
+        times = np.memmap(tmp,dtype='<f8',mode='r+',offset=HEADER_SIZE,shape=(size,))
+        data = np.memmap(tmp,dtype='<i4',mode='r+',offset=HEADER_SIZE+8*size,shape=(channels,size))
+        for block in read_blocks(fn):
+            values = np.fromstring(block,sep=' ')
+            if values.size % (channels+2) != 0 or values.size > (block.count('\n'))*(channels+2):
+                raise IOError(fn+" is not a movement log with "+str(channels)+" channels (near line "+str(rows+1)+")")
+            values = values.reshape((-1,channels+2))
+            n = len(values)
+            if n == 0:
+                continue
+            times[rows:rows+n] = unix2num(values[:,0]+values[:,1]*1e-6)
+            data[:,rows:rows+n] = values[:,2:].T
+            if rows == 0:
+                lows = values[:,2:].min(axis=0)
+                highs = values[:,2:].max(axis=0)
+            else:
+                lows = np.minimum(lows,values[:,2:].min(axis=0))
+                highs = np.maximum(highs,values[:,2:].max(axis=0))
+            rows += n
+            if progress is not None:
+                progress(float(rows)/size,times[:rows],data[:,:rows],lows,highs)
+        if rows == 0:
+            raise IOError(fn+" contains no samples")
+    except:
+        del times
+        del data
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    times.flush()
+    data.flush()
+    del times
+    del data
+    st = os.stat(fn)
+    with open(tmp,'r+b') as h:
+        h.write(HEADER.pack(MAGIC,size,rows,channels,st.st_size,st.st_mtime))
+        h.write(np.asarray(lows,dtype='<f8').tostring())
+        h.write(np.asarray(highs,dtype='<f8').tostring())
+    os.rename(tmp,target)
+
+def open_cache(fn):
+    """
+    :param fn: The name of the cache file
+    :type fn: :class:`str`
+    :returns: The timestamps, the samples with one row per channel and the minimum and maximum of every channel
+    :rtype: (:class:`numpy.memmap`, :class:`numpy.memmap`, :class:`numpy.ndarray`, :class:`numpy.ndarray`)"""
+    with open(fn,'rb') as h:
+        header = h.read(HEADER_SIZE)
+    (magic,size,rows,channels,src_size,src_mtime) = HEADER.unpack(header[:HEADER.size])
+    if magic != MAGIC:
+        raise IOError(fn+" is not a source cache file")
+    bounds = np.fromstring(header[HEADER.size:HEADER.size+16*channels],dtype='<f8')
+    times = np.memmap(fn,dtype='<f8',mode='r',offset=HEADER_SIZE,shape=(size,))[:rows]
+    data = np.memmap(fn,dtype='<i4',mode='r',offset=HEADER_SIZE+8*size,shape=(channels,size))[:,:rows]
+    return (times,data,bounds[:channels],bounds[channels:])
+
+class MemmapSource:
+    """
+    :param name: The name of the source
+    :type name: :class:`str`
+    :param times: The timestamps of the samples
+    :type times: :class:`numpy.memmap`
+    :param data: The samples, one row per timestamp
+    :type data: :class:`numpy.memmap`
+    :param bounds: The minimal and maximal sample value
+    :type bounds: (:class:`float`, :class:`float`)
+
+    A source for movement logs that are too big to be parsed into memory.
+    The log is converted once into a cache file, all data is then served as
+    slices of a memory map of that file.
+
+    .. attribute:: progressive
+
+       Marks that :func:`from_file` reports its progress and partial results to a :class:`loader.SourceLoader`.
+
+    .. attribute:: summary_block
+
+       The number of samples that are combined into one block of the summary used for wide windows (see :func:`get_range`).
+    """
+    progressive = True
+    summary_block = 256
+    def __init__(self,name,times,data,bounds):
+        self.name = name
+        self.times = times
+        self.data = data
+        self.data_bounds = bounds
+        self.summary = None
+        self.summary_lock = threading.Lock()
+    @staticmethod
+    def description():
+        return _("Movement log (memory-mapped)")
+    @staticmethod
+    def arg_description():
+        return [('channels','choice',[(_("Channel")+" "+str(i+1),i) for i in range(6)],_("Channels"))]
+    @staticmethod
+    def from_file(fn,name,channels=(),progress=None):
+        """
+        :param fn: The name of the log file
+        :type fn: :class:`str`
+        :param name: The name of the new sources
+        :type name: :class:`str`
+        :param channels: The channels to load, one source is created for each. All channels are shown in one source if none are given.
+        :type channels: :class:`set`
+        :param progress: Informed about the progress of the conversion, gets the sources converted so far as partial result
+        :type progress: :class:`loader.SourceLoader`
+        :rtype: \[ :class:`MemmapSource` \]"""
+        target = cache_file(fn)
+        if not os.path.exists(target):
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR)
+            if progress is None:
+                convert(fn,target)
+            else:
+                convert(fn,target,progress=lambda fraction,times,data,lows,highs:
+                        progress.update(fraction,lambda: MemmapSource.create(name,times,data,lows,highs,channels)))
+        (times,data,lows,highs) = open_cache(target)
+        return MemmapSource.create(name,times,data,lows,highs,channels)
+    @staticmethod
+    def create(name,times,data,lows,highs,channels=()):
+        """
+        :param data: The samples with one row per channel
+        :type data: :class:`numpy.memmap`
+        :param lows: The minimum of every channel
+        :type lows: :class:`numpy.ndarray`
+        :param highs: The maximum of every channel
+        :type highs: :class:`numpy.ndarray`
+        :rtype: \[ :class:`MemmapSource` \]
+
+        Creates the sources for the given channels of a cache file (see :func:`open_cache`)."""
+        if len(channels) == 0:
+            return [MemmapSource(name,times,data.T,(lows.min(),highs.max()))]
+        return [MemmapSource(name+" ("+str(i+1)+")",times,data[i],(lows[i],highs[i]))
+                for i in sorted(channels)]
+    def get_name(self):
+        return self.name
+    def get_time(self,cached=True):
+        return self.times
+    def get_data(self,cached=True):
+        return self.data
+    def get_range(self,start,end,max_points):
+        """
+        :param start: The start of the window
+        :type start: :class:`float`
+        :param end: The end of the window
+        :type end: :class:`float`
+        :param max_points: The maximal number of points that should be returned
+        :type max_points: :class:`int`
+        :returns: Timestamps and samples of the window, with one column per channel
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+
+        Reads only the samples of the window (and one beyond each side) and summarizes them if there are more than *max_points* (see :func:`lod.decimate`).
+        Windows that are so wide that even blocks of :attr:`summary_block` samples would be too many points are
+        served from a min/max-summary of the whole source instead, which is built on first use."""
+        i0 = max(np.searchsorted(self.times,start,'left')-1,0)
+        i1 = min(np.searchsorted(self.times,end,'right')+1,len(self.times))
+        if 2*(i1-i0) >= self.summary_block*max_points:
+            (times,data) = self.get_summary()
+            i0 = max(np.searchsorted(times,start,'left')-1,0)
+            i1 = min(np.searchsorted(times,end,'right')+1,len(times))
+            return decimate(times[i0:i1],data[i0:i1],max_points)
+        return decimate(self.times[i0:i1],self.data[i0:i1],max_points)
+    def get_summary(self):
+        """
+        :returns: Timestamps and samples of the minimum and maximum of every block of :attr:`summary_block` samples
+        :rtype: (:class:`numpy.ndarray`, :class:`numpy.ndarray`)"""
+        with self.summary_lock:
+            if self.summary is None:
+                rows = self.summary_block*1024
+                parts = []
+                for i in xrange(0,len(self.times),rows):
+                    parts.append(decimate(self.times[i:i+rows],np.asarray(self.data[i:i+rows]),
+                                          2*((min(rows,len(self.times)-i)+self.summary_block-1)//self.summary_block)))
+                self.summary = (np.concatenate([t for (t,d) in parts]),np.concatenate([d for (t,d) in parts]))
+            return self.summary
+    def get_time_bounds(self):
+        return (float(self.times[0]),float(self.times[-1]))
+    def get_data_bounds(self):
+        return self.data_bounds
+    def hasCapability(self,name):
+        return name == "play"
+    def getPlayData(self,start,end):
+        """
+        :param start: The start of the played range
+        :type start: :class:`datetime.datetime`
+        :param end: The end of the played range
+        :type end: :class:`datetime.datetime`
+        :returns: The samples of the first channel in the range and the sample rate
+        :rtype: (:class:`numpy.ndarray`, :class:`int`)"""
+        i0 = np.searchsorted(self.times,date2num(start),'left')
+        i1 = np.searchsorted(self.times,date2num(end),'right')
+        duration = (self.times[-1]-self.times[0])*86400.0
+        rate = int(round((len(self.times)-1)/duration)) if duration > 0 else 1
+        if self.data.ndim == 1:
+            return (self.data[i0:i1],rate)
+        return (self.data[i0:i1,0],rate)
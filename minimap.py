@@ -0,0 +1,274 @@
+"""
+The overview strip
+==================
+"""
+import gobject
+import threading
+import weakref
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_gtkagg import FigureCanvasGTKAgg as FigureCanvas
+
+_envelopes = weakref.WeakKeyDictionary()
+
+def envelope(src,bins=1024):
+    """
+    :param src: The source
+    :type src: :class:`sources.Source`
+    :param bins: The number of time bins
+    :type bins: :class:`int`
+    :returns: The bin edges and the minimum and maximum of all channels in every bin, scaled to the data bounds of the source.
+              Bins without samples are masked.
+    :rtype: (:class:`numpy.ndarray`, :class:`numpy.ma.MaskedArray`, :class:`numpy.ma.MaskedArray`)
+
+    Sources that keep a min/max-summary (like :class:`memmapsource.MemmapSource`) are binned from it instead of their samples.
+    The envelope is computed once per source object and then remembered."""
+    try:
+        return _envelopes[src]
+    except (KeyError,TypeError):
+        pass
+    if hasattr(src,'get_summary'):
+        (times,data) = src.get_summary()
+    else:
+        (times,data) = (src.get_time(True),src.get_data(True))
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data.reshape((-1,1))
+    (tl,tr) = src.get_time_bounds()
+    (dl,dr) = src.get_data_bounds()
+    edges = np.linspace(tl,tr,bins+1)
+    idx = np.searchsorted(times,edges[:-1],'left')
+    filled = idx < np.append(idx[1:],len(times))
+    lo = np.ma.masked_all(bins)
+    hi = np.ma.masked_all(bins)
+    if filled.any():
+        starts = idx[filled]
+        scale = (dr-dl) if dr > dl else 1.0
+        lo[filled] = (np.minimum.reduceat(data,starts,axis=0).min(axis=1)-dl)/scale
+        hi[filled] = (np.maximum.reduceat(data,starts,axis=0).max(axis=1)-dl)/scale
+    res = (edges,lo,hi)
+    try:
+        _envelopes[src] = res
+    except TypeError:
+        pass
+    return res
+
+def density(starts,ends,edges):
+    """
+    :param starts: The start-times of the annotations
+    :type starts: :class:`numpy.ndarray`
+    :param ends: The end-times of the annotations
+    :type ends: :class:`numpy.ndarray`
+    :param edges: The edges of the time bins
+    :type edges: :class:`numpy.ndarray`
+    :returns: The fraction of every bin that is annotated, at most 1
+    :rtype: :class:`numpy.ndarray`
+
+    Computed from the sorted start- and end-times, so it takes O((n+bins) log n) time for n annotations."""
+    origin = edges[0]
+    res = []
+    for bounds in (starts,ends):
+        b = np.sort(np.asarray(bounds,dtype=np.float64)-origin)
+        sums = np.append(0.0,np.cumsum(b))
+        cnt = np.searchsorted(b,edges-origin,'left')
+        res.append(cnt*(edges-origin)-sums[cnt])
+    covered = res[0]-res[1]
+    return np.clip(np.diff(covered)/np.diff(edges),0.0,1.0)
+
+class EnvelopeBuilder(threading.Thread):
+    """
+    :param src: The source
+    :type src: :class:`sources.Source`
+    :param end_cb: Called with the source and its envelope in the main loop
+    :type end_cb: :func:`callable`
+
+    Computes the :func:`envelope` of a source in the background."""
+    def __init__(self,src,end_cb):
+        threading.Thread.__init__(self,name="envelope thread")
+        self.daemon = True
+        self.src = src
+        self.end_cb = end_cb
+    def run(self):
+        env = envelope(self.src)
+        gobject.idle_add(self.end_cb,self.src,env)
+
+class MinimapMeta(gobject.GObjectMeta):
+    def __init__(cls,*kwds):
+        gobject.GObjectMeta.__init__(cls,*kwds)
+        cls.__gtype_name__ = cls.__name__
+        gobject.signal_new('position-request', cls,
+                           gobject.SIGNAL_RUN_FIRST,
+                           gobject.TYPE_NONE,
+                           (gobject.TYPE_DOUBLE,))
+        gobject.type_register(cls)
+
+class Minimap(FigureCanvas):
+    """
+    :param model: The annotation data-model to be summarized
+    :type model: :class:`annotation.Annotations`
+
+    Shows the whole recording at once: the min/max envelope of every source and, in one lane per context
+    and in the color of the context, how much of the time is annotated. The visible window is marked.
+    The envelopes are computed once in the background (see :func:`envelope`), afterwards the strip never reads samples again.
+    Changes of the annotations are collected for :attr:`delay` milliseconds and then only the lanes of the
+    changed contexts are recomputed.
+
+    +---------------------+------------------------+-------------------------+
+    |Signal               | Signature              | Description             |
+    +=====================+========================+=========================+
+    |"position-request"   |:class:`float`          | Called when the user    |
+    |                     |                        | clicks or drags in the  |
+    |                     |                        | strip. Gives the time   |
+    |                     |                        | that should be shown in |
+    |                     |                        | the middle of the       |
+    |                     |                        | window.                 |
+    +---------------------+------------------------+-------------------------+
+
+    .. attribute:: bins
+
+       The number of time bins of the annotation density.
+
+    .. attribute:: lane_height
+
+       The height of a context lane relative to the height of the envelopes.
+
+    .. attribute:: delay
+
+       The time in milliseconds for which changes of the annotations are collected before the lanes are updated.
+    """
+    __metaclass__ = MinimapMeta
+    bins = 512
+    lane_height = 0.25
+    delay = 200
+    def __init__(self,model):
+        self.model = model
+        self.sources = []
+        self.envelopes = dict()
+        self.bounds = None
+        self.density_pending = False
+        self.dirty = set()
+        self.lanes = dict()
+        self.dragging = False
+        figure = Figure(dpi=100)
+        self.plot = figure.add_axes((0,0,1,1),autoscale_on=False)
+        self.plot.set_axis_off()
+        self.envelope_artists = []
+        self.marker = self.plot.axvspan(0,0,facecolor='k',alpha=0.2,visible=False)
+        FigureCanvas.__init__(self,figure)
+        self.set_size_request(-1,60)
+        self.mpl_connect('button_press_event',self.on_press)
+        self.mpl_connect('button_release_event',self.on_release)
+        self.mpl_connect('motion_notify_event',self.on_move)
+        model.connect('annotation-added',self.notice_annotation)
+        model.connect('annotation-changed',self.notice_annotation_change)
+        for signal in ('annotation-removed','annotations-bulk-changed','context-added','context-removed'):
+            model.connect(signal,self.notice_change)
+    def add_source(self,src):
+        """
+        :param src: The source to summarize
+        :type src: :class:`sources.Source`"""
+        self.sources.append(src)
+        try:
+            self.envelopes[src] = _envelopes[src]
+            self.update_envelopes()
+        except (KeyError,TypeError):
+            EnvelopeBuilder(src,self.envelope_done).start()
+    def remove_source(self,src):
+        self.sources.remove(src)
+        self.envelopes.pop(src,None)
+        self.update_envelopes()
+    def envelope_done(self,src,env):
+        if src in self.sources:
+            self.envelopes[src] = env
+            self.update_envelopes()
+        return False
+    def update_envelopes(self):
+        """
+        Replots the envelopes of all sources whose envelope is ready."""
+        for artist in self.envelope_artists:
+            artist.remove()
+        self.envelope_artists = []
+        for src in self.sources:
+            if src in self.envelopes:
+                (edges,lo,hi) = self.envelopes[src]
+                centers = (edges[:-1]+edges[1:])/2
+                self.envelope_artists.append(self.plot.fill_between(centers,lo,hi,linewidth=0,alpha=0.3,color='k'))
+        self.draw_idle()
+    def update_density(self):
+        """
+        Replots the annotation density of the changed contexts, or of all contexts if the contexts
+        or the range of the recording have changed."""
+        self.density_pending = False
+        dirty = self.dirty
+        self.dirty = set()
+        contexts = sorted(self.model.contexts())
+        if dirty is None or [name for (name,color) in contexts] != sorted(self.lanes):
+            for artist in self.lanes.itervalues():
+                if artist is not None:
+                    artist.remove()
+            self.lanes = dict()
+            dirty = set(name for (name,color) in contexts)
+        self.plot.set_ylim(-self.lane_height*len(contexts),1)
+        if self.bounds is not None and self.bounds[1] > self.bounds[0]:
+            edges = np.linspace(self.bounds[0],self.bounds[1],self.bins+1)
+            centers = (edges[:-1]+edges[1:])/2
+            for (i,(name,color)) in enumerate(contexts):
+                if name not in dirty:
+                    continue
+                if self.lanes.get(name) is not None:
+                    self.lanes[name].remove()
+                self.lanes[name] = None
+                (names,starts,ends) = self.model.columns(name)
+                if len(starts) == 0:
+                    continue
+                base = -self.lane_height*(i+1)
+                self.lanes[name] = self.plot.fill_between(centers,base,base+self.lane_height*density(starts,ends,edges),
+                                                          linewidth=0,color=color)
+        else:
+            self.lanes = dict((name,self.lanes.get(name)) for (name,color) in contexts)
+        self.draw_idle()
+        return False
+    def __schedule(self):
+        if not self.density_pending:
+            self.density_pending = True
+            gobject.timeout_add(self.delay,self.update_density)
+    def notice_annotation(self,model,id,color,start,end):
+        if self.dirty is not None:
+            self.dirty.add(model.get_annotation(id)[0])
+        self.__schedule()
+    def notice_annotation_change(self,model,id,ctx,color,start,end):
+        if self.dirty is not None:
+            self.dirty.add(ctx)
+        self.__schedule()
+    def notice_change(self,model,*args):
+        self.dirty = None
+        self.__schedule()
+    def update_zoom(self,xmin,xmax,policy):
+        """
+        :param xmin: The start of the recording
+        :type xmin: :class:`float`
+        :param xmax: The end of the recording
+        :type xmax: :class:`float`
+        :param policy: The policy that decides the visible window
+        :type policy: :class:`main.ScalePolicy`
+
+        Moves the marker of the visible window. The density is only recomputed if the range of the recording has changed."""
+        if (xmin,xmax) != self.bounds:
+            self.bounds = (xmin,xmax)
+            if xmax > xmin:
+                self.plot.set_xlim(xmin,xmax)
+            self.dirty = None
+            self.update_density()
+        (vall,valr) = policy.get_bounds()
+        self.marker.set_xy([(vall,0),(vall,1),(valr,1),(valr,0),(vall,0)])
+        self.marker.set_visible(True)
+        self.draw_idle()
+    def on_press(self,event):
+        if event.xdata is not None and event.button == 1:
+            self.dragging = True
+            self.emit('position-request',event.xdata)
+    def on_release(self,event):
+        self.dragging = False
+    def on_move(self,event):
+        if event.xdata is not None and self.dragging:
+            self.emit('position-request',event.xdata)
@@ -0,0 +1,74 @@
+"""
+Read-ahead while scrolling
+==========================
+"""
+import threading
+
+class Prefetcher(threading.Thread):
+    """
+    Runs jobs that prepare data which will probably be needed soon on a background thread.
+    Only the most recent batch of jobs is kept: when the user scrolls faster than the jobs
+    can be run, the jobs for windows that have already been scrolled past are dropped.
+
+    .. attribute:: direction
+
+       The predicted direction of scrolling, positive for forward, negative for backward and 0 if unknown.
+    """
+    def __init__(self):
+        threading.Thread.__init__(self,name="prefetch thread")
+        self.daemon = True
+        self.cond = threading.Condition()
+        self.jobs = []
+        self.stopped = False
+        self.last_pos = None
+        self.direction = 0
+    def observe(self,pos):
+        """
+        :param pos: The new start of the visible window
+        :type pos: :class:`float`
+        :returns: The predicted direction of scrolling
+        :rtype: :class:`int`
+
+        Predicts the direction of scrolling from the change of the position.
+        A position that doesn't change keeps the last prediction."""
+        if self.last_pos is not None:
+            if pos > self.last_pos:
+                self.direction = 1
+            elif pos < self.last_pos:
+                self.direction = -1
+        self.last_pos = pos
+        return self.direction
+    def reset(self):
+        """
+        Forgets the last position and direction, e.g. after the zoom level has changed."""
+        self.last_pos = None
+        self.direction = 0
+    def request(self,jobs):
+        """
+        :param jobs: The jobs to run, called without arguments
+        :type jobs: \[ :func:`callable` \]
+
+        Replaces all jobs that haven't been started yet."""
+        with self.cond:
+            self.jobs = list(jobs)
+            self.cond.notify()
+    def stop(self):
+        """
+        Drops all pending jobs and ends the thread after the current job."""
+        with self.cond:
+            self.jobs = []
+            self.stopped = True
+            self.cond.notify()
+    def run(self):
+        while True:
+            with self.cond:
+                while len(self.jobs) == 0 and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                job = self.jobs.pop(0)
+            try:
+                job()
+            except Exception:
+                # the window is fetched again when it is shown, which reports the error
+                pass
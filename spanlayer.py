@@ -0,0 +1,66 @@
+"""
+The annotation layer
+====================
+"""
+from matplotlib.collections import PolyCollection
+from matplotlib.transforms import blended_transform_factory
+
+class SpanLayer:
+    """
+    :param axes: The axes on which the annotations are drawn
+    :type axes: :class:`matplotlib.axes.Axes`
+    :param model: The annotation data-model to be displayed
+    :type model: :class:`annotation.Annotations`
+    :param alpha: The opacity of the spans
+    :type alpha: :class:`float`
+
+    Draws the annotations that intersect the visible time window as vertical spans.
+    All spans of one context color are batched into a single collection,
+    annotations outside of the window are not drawn at all.
+    """
+    def __init__(self,axes,model,alpha=0.3):
+        self.axes = axes
+        self.model = model
+        self.alpha = alpha
+        self.transform = blended_transform_factory(axes.transData,axes.transAxes)
+        self.collections = []
+        self.bounds = None
+        self.hidden = None
+    def hide(self,id):
+        """
+        :param id: The id of the annotation to leave out or :const:`None` to show all
+        :type id: :class:`int`
+
+        Leaves out an annotation, e.g. because it is shown as a preview while it is being changed."""
+        self.hidden = id
+        self.refresh()
+    def intersects(self,boundl,boundr):
+        """
+        :rtype: :class:`bool`
+
+        Checks whether a time range is visible in the current window."""
+        return self.bounds is not None and boundl <= self.bounds[1] and boundr >= self.bounds[0]
+    def refresh(self,bounds=None):
+        """
+        :param bounds: The new visible time window or :const:`None` to keep the current one
+        :type bounds: (:class:`float`, :class:`float`)
+
+        Rebuilds the collections from the annotations in the visible window."""
+        if bounds is not None:
+            self.bounds = bounds
+        for col in self.collections:
+            col.remove()
+        self.collections = []
+        if self.bounds is None:
+            return
+        spans = dict()
+        for id in self.model.find_range(self.bounds[0],self.bounds[1]):
+            if id == self.hidden:
+                continue
+            (ctx,color,boundl,boundr) = self.model.get_annotation(id)
+            spans.setdefault(color,[]).append(((boundl,0),(boundl,1),(boundr,1),(boundr,0)))
+        for (color,verts) in spans.iteritems():
+            col = PolyCollection(verts,facecolors=color,edgecolors='none',alpha=self.alpha,
+                                 transform=self.transform)
+            self.axes.add_collection(col,autolim=False)
+            self.collections.append(col)
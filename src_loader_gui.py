@@ -1,4 +1,5 @@
 import gtk
+import gobject
 from dateentry import DateEdit
 
 class LoadSourceDialog(gtk.Dialog):
@@ -40,6 +41,11 @@ class LoadSourceDialog(gtk.Dialog):
                 group = opt
             line+=2
         self.child.add(table)
+        self.table = table
+        self.progress = gtk.ProgressBar()
+        self.progress.set_no_show_all(True)
+        self.child.pack_end(self.progress,expand=False,fill=True)
+        self.pulse_id = None
         self.add_buttons(gtk.STOCK_CANCEL,gtk.RESPONSE_CANCEL,gtk.STOCK_OPEN,gtk.RESPONSE_OK)
         self.update_hide_show()
         self.show_all()
@@ -75,7 +81,10 @@ class LoadSourceDialog(gtk.Dialog):
                 line += 1
             widgets[name] = widget
         return (box,widgets)
-    def get_source(self):
+    def get_arguments(self):
+        """
+        :returns: The chosen source type, file name, name of the source and the additional arguments for :func:`from_file`
+        :rtype: (:class:`sources.Source`, :class:`str`, :class:`str`, :class:`dict`)"""
         fn = self.openw.get_filename()
         dname = self.fn_entry.get_text()
         for src,wid,box,opts in self.file_type_option:
@@ -90,4 +99,30 @@ class LoadSourceDialog(gtk.Dialog):
                             if wid.get_active():
                                 res_set.add(val)
                         res[name] = res_set
-                return src.from_file(fn,dname,**res)
+                return (src,fn,dname,res)
+    def get_source(self):
+        (src,fn,dname,res) = self.get_arguments()
+        return src.from_file(fn,dname,**res)
+    def show_progress(self):
+        """
+        Switches the dialog into loading mode: the options can no longer be changed and a progress bar is shown.
+        It pulses until the first progress is reported by :func:`set_progress`."""
+        self.table.set_sensitive(False)
+        self.set_response_sensitive(gtk.RESPONSE_OK,False)
+        self.progress.set_text(_("Loading..."))
+        self.progress.show()
+        self.pulse_id = gobject.timeout_add(100,self.__pulse)
+    def __pulse(self):
+        self.progress.pulse()
+        return True
+    def set_progress(self,fraction):
+        if self.pulse_id is not None:
+            gobject.source_remove(self.pulse_id)
+            self.pulse_id = None
+        self.progress.set_fraction(fraction)
+        self.progress.set_text("%d%%" % int(fraction*100))
+    def destroy(self):
+        if self.pulse_id is not None:
+            gobject.source_remove(self.pulse_id)
+            self.pulse_id = None
+        gtk.Dialog.destroy(self)
@@ -0,0 +1,104 @@
+"""
+Time axis ticks
+===============
+"""
+import math
+import datetime
+import numpy as np
+from matplotlib.ticker import Locator,Formatter
+
+SECONDS_PER_DAY = 86400
+
+class StepLocator(Locator):
+    """
+    :param step: The distance between two ticks in seconds
+    :type step: :class:`float`
+
+    Places ticks on all multiples of a fixed number of seconds (in UTC), like
+    :class:`matplotlib.dates.MinuteLocator` or :class:`matplotlib.dates.SecondLocator`
+    with an interval, but computes them arithmetically from the visible window
+    instead of iterating over dates.
+    """
+    def __init__(self,step):
+        self.step = step
+    def __call__(self):
+        (vmin,vmax) = self.axis.get_view_interval()
+        return self.tick_values(vmin,vmax)
+    def tick_values(self,vmin,vmax):
+        if vmax < vmin:
+            (vmin,vmax) = (vmax,vmin)
+        width = self.step/float(SECONDS_PER_DAY)
+        k0 = int(math.ceil(vmin/width-1e-6))
+        k1 = int(math.floor(vmax/width+1e-6))
+        return self.raise_if_exceeds(np.arange(k0,k1+1)*width)
+
+class StepFormatter(Formatter):
+    """
+    :param step: The distance between two ticks in seconds
+    :type step: :class:`float`
+
+    Labels the ticks of a :class:`StepLocator` with the time of day (in UTC), including
+    the seconds only if the step is not a multiple of a minute and their fractions only if the step is shorter
+    than a second. Steps of whole days are labelled with the date. The labels are
+    computed from the number of the tick without converting it to a date and are remembered,
+    so scrolling only formats the ticks that come into view.
+
+    .. attribute:: max_labels
+
+       The number of labels that are remembered.
+    """
+    max_labels = 4096
+    def __init__(self,step):
+        self.step = step
+        self.labels = dict()
+        if step < 1:
+            self.decimals = int(-math.floor(math.log10(step)+1e-9))
+        else:
+            self.decimals = 0
+        self.scale = 10**self.decimals
+        self.istep = int(round(step*self.scale))
+    def __call__(self,x,pos=None):
+        k = int(round(x*SECONDS_PER_DAY/self.step))
+        try:
+            return self.labels[k]
+        except KeyError:
+            pass
+        label = self.format_tick(k)
+        if len(self.labels) >= self.max_labels:
+            self.labels.clear()
+        self.labels[k] = label
+        return label
+    def format_tick(self,k):
+        """
+        :param k: The number of the tick, counted from the start of the time axis
+        :type k: :class:`int`
+        :rtype: :class:`str`"""
+        total = k*self.istep
+        if self.istep % (SECONDS_PER_DAY*self.scale) == 0:
+            return datetime.date.fromordinal(total//(SECONDS_PER_DAY*self.scale)).isoformat()
+        (secs,frac) = divmod(total % (SECONDS_PER_DAY*self.scale),self.scale)
+        if self.istep % (60*self.scale) == 0:
+            return "%02d:%02d" % (secs//3600,(secs//60)%60)
+        if self.decimals == 0:
+            return "%02d:%02d:%02d" % (secs//3600,(secs//60)%60,secs%60)
+        return "%02d:%02d:%02d.%0*d" % (secs//3600,(secs//60)%60,secs%60,self.decimals,frac)
+
+STEPS = [0.001,0.002,0.005,0.01,0.02,0.05,0.1,0.2,0.5,
+         1,2,5,10,15,20,30,
+         60,120,300,600,900,1200,1800,
+         3600,7200,10800,21600,43200,
+         86400,172800,604800,2419200]
+
+def step_for(window,max_ticks=8):
+    """
+    :param window: The width of the visible window in days
+    :type window: :class:`float`
+    :param max_ticks: The maximal number of ticks in the window
+    :type max_ticks: :class:`int`
+    :returns: The shortest of :data:`STEPS` that puts at most *max_ticks* ticks into the window
+    :rtype: :class:`float`"""
+    secs = window*SECONDS_PER_DAY
+    for step in STEPS:
+        if secs/step <= max_ticks:
+            return step
+    return STEPS[-1]